@@ -1,17 +1,13 @@
 # backend/app/approve.py
 from fastapi import APIRouter, HTTPException, Body, Header
 import os
-from pymongo import MongoClient
-from .versioning import create_new_version, get_latest_schema_meta
+from .versioning import get_latest_schema_meta, activate_version
+from .mongo import mongo_db
 
 router = APIRouter()
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
 PROMOTE_TOKEN = os.getenv("PROMOTE_TOKEN", "demo-token")
 
-client = MongoClient(MONGO_URL)
-db = client["chrysalis"]
-
 @router.post("/approve")
 async def approve_promotion(
     request: dict = Body(...),
@@ -32,6 +28,7 @@ async def approve_promotion(
     # Find schema by ID
     try:
         from bson import ObjectId
+        db = mongo_db()
         schema_doc = db.schema_registry.find_one({"_id": ObjectId(schema_id)})
         if not schema_doc:
             raise HTTPException(404, detail="Schema not found")
@@ -42,7 +39,12 @@ async def approve_promotion(
             {"$set": {"pending_promotion": True, "promoted_at": __import__("datetime").datetime.utcnow().isoformat()}}
         )
         
-        return {"status": "approved", "schema_id": schema_id, "version": schema_doc.get("version")}
+        # approving makes the version active; the change event starts DLQ revalidation
+        activate_version(schema_doc["version"])
+        
+        return {"status": "approved", "schema_id": schema_id, "version": schema_doc.get("version"), "active": True}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
@@ -0,0 +1,150 @@
+# backend/app/blobstore.py
+"""
+Externalized storage for oversized documents.
+
+StorageManager measures each accepted document's BSON size while encoding it. Above
+EXTERNALIZE_BYTES, externalize() moves every field whose BSON encoding is at least
+EXTERNALIZE_FIELD_BYTES into the blob store. If the rest is still too large, the whole body goes
+instead. raw_data keeps a compact reference document:
+
+  field:  {"<field>": {"_blob_ref": <sha256>, "_blob_store": "gridfs", "_blob_size": n}, ...,
+           "_externalized": ["<field>", ...]}
+  body:   {"_blob_ref": ..., "_blob_store": ..., "_blob_size": n, "_externalized": "body"}
+
+Blobs are content-addressed (sha256 of the JSON bytes), so identical payloads are stored once.
+BLOB_STORE=gridfs (the default) uses the raw_blobs GridFS bucket; BLOB_STORE=local writes to
+BLOB_DIR/<ab>/<cd>/<sha256>. Readers get the compact documents and call rehydrate() for the
+fields they need; nothing is fetched until then.
+"""
+import os, hashlib
+
+import orjson
+import gridfs
+from bson import encode as bson_encode
+from .mongo import mongo_db
+
+EXTERNALIZE_BYTES = int(os.getenv("EXTERNALIZE_BYTES", str(1024 * 1024)))
+EXTERNALIZE_FIELD_BYTES = int(os.getenv("EXTERNALIZE_FIELD_BYTES", str(256 * 1024)))
+BLOB_STORE = os.getenv("BLOB_STORE", "gridfs")
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+
+# fields that stay on the reference document
+_KEEP = ("_id", "_schema_version", "_ingest_job_id", "_ingest_ts", "_source", "_doc_hash")
+
+class GridFSBlobStore:
+    name = "gridfs"
+
+    def __init__(self, database=None, bucket="raw_blobs"):
+        database = database if database is not None else mongo_db()
+        self.bucket = gridfs.GridFSBucket(database, bucket_name=bucket)
+        self.files = database[f"{bucket}.files"]
+
+    def put(self, data):
+        ref = hashlib.sha256(data).hexdigest()
+        if self.files.find_one({"filename": ref}, {"_id": 1}) is None:
+            self.bucket.upload_from_stream(ref, data, metadata={"size": len(data)})
+        return ref
+
+    def get(self, ref):
+        return self.bucket.open_download_stream_by_name(ref).read()
+
+class LocalBlobStore:
+    name = "local"
+
+    def __init__(self, root=None):
+        self.root = root or BLOB_DIR
+
+    def _path(self, ref):
+        return os.path.join(self.root, ref[:2], ref[2:4], ref)
+
+    def put(self, data):
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return ref
+
+    def get(self, ref):
+        with open(self._path(ref), "rb") as f:
+            return f.read()
+
+_stores = {}
+
+def get_store(name=None):
+    """Blob store by name (BLOB_STORE by default), created once per process."""
+    name = name or BLOB_STORE
+    store = _stores.get(name)
+    if store is None:
+        if name == "gridfs":
+            store = GridFSBlobStore()
+        elif name == "local":
+            store = LocalBlobStore()
+        else:
+            raise ValueError(f"unknown blob store {name!r}")
+        _stores[name] = store
+    return store
+
+def _ref(store, value):
+    data = orjson.dumps(value)
+    return {"_blob_ref": store.put(data), "_blob_store": store.name, "_blob_size": len(data)}
+
+def externalize(doc, size, store=None):
+    """
+    Compact copy of doc (whose BSON size is `size`) with its large fields, or its whole body,
+    moved to the blob store. doc itself is not modified.
+    """
+    store = store or get_store()
+    out, moved = {}, []
+    remaining = size
+    for k, v in doc.items():
+        if k in _KEEP or not isinstance(v, (dict, list, str)):
+            out[k] = v
+            continue
+        # the field's share of the document's BSON size
+        n = len(bson_encode({k: v})) - 5
+        if n >= EXTERNALIZE_FIELD_BYTES:
+            out[k] = _ref(store, v)
+            moved.append(k)
+            remaining -= n
+        else:
+            out[k] = v
+    if remaining > EXTERNALIZE_BYTES:
+        body = {k: v for k, v in doc.items() if k not in _KEEP}
+        out = {k: doc[k] for k in _KEEP if k in doc}
+        out.update(_ref(store, body))
+        out["_externalized"] = "body"
+        return out
+    out["_externalized"] = moved
+    return out
+
+def rehydrate(doc, fields=None):
+    """
+    Load externalized content back into doc (in place) and return it. fields limits which
+    externalized fields are fetched; a whole-body reference is always fetched.
+    """
+    ext = doc.get("_externalized")
+    if not ext:
+        return doc
+    if ext == "body":
+        body = orjson.loads(get_store(doc["_blob_store"]).get(doc["_blob_ref"]))
+        for k in ("_blob_ref", "_blob_store", "_blob_size", "_externalized"):
+            doc.pop(k, None)
+        doc.update(body)
+        return doc
+    remaining = []
+    for k in ext:
+        ref = doc.get(k)
+        if fields is not None and k not in fields:
+            remaining.append(k)
+            continue
+        if isinstance(ref, dict) and "_blob_ref" in ref:
+            doc[k] = orjson.loads(get_store(ref["_blob_store"]).get(ref["_blob_ref"]))
+    if remaining:
+        doc["_externalized"] = remaining
+    else:
+        doc.pop("_externalized", None)
+    return doc
@@ -0,0 +1,118 @@
+# backend/app/dedupe.py
+"""
+Content-hash deduplication for raw_data (DEDUPE_DOCS=1).
+
+The worker inserts stamped copies of the accepted documents (the decoded job is left as it
+came): _doc_hash is a canonical (key-order-insensitive) hash of the document as the producer
+sent it. raw_data has a unique partial index on _doc_hash, so a duplicate insert is rejected by
+Mongo and dropped instead of going to the DLQ.
+
+DocDeduper keeps an in-process Bloom filter of hashes it has seen written. A Bloom hit only means
+"maybe": those hashes are confirmed with one $in query per batch before the documents are skipped,
+so a false positive never drops a new document. Misses go straight to the insert and the unique
+index catches whatever the filter has not seen (other workers, restarts).
+
+The unique index is per collection, so with RAW_PARTITION_MODE it cannot see a copy stored in
+another partition, and the Bloom filter is empty after a restart. Partitioned deduplication
+therefore confirms every hash of the batch, not only Bloom hits, through the read router: one
+indexed $in per partition per batch. Only two copies inserted into different partitions at the
+same moment can both get through.
+"""
+import os, math, hashlib
+
+import orjson
+
+DEDUPE_DOCS = os.getenv("DEDUPE_DOCS", "0") == "1"
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", "1000000"))
+BLOOM_FP_RATE = float(os.getenv("BLOOM_FP_RATE", "0.01"))
+
+_META_FIELDS = ("_id", "_schema_version", "_ingest_job_id", "_ingest_ts", "_source", "_doc_hash")
+
+def doc_hash(doc):
+    """Canonical content hash of a document (nested keys sorted); ingest metadata excluded."""
+    if any(k in doc for k in _META_FIELDS):
+        doc = {k: v for k, v in doc.items() if k not in _META_FIELDS}
+    return hashlib.sha1(orjson.dumps(doc, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+def stamped(docs):
+    """Copies of docs carrying their _doc_hash; the originals are not touched."""
+    return [{**d, "_doc_hash": doc_hash(d)} for d in docs]
+
+def unstamped(failures):
+    """Failures ([{"doc", "reason"}, ...]) of stamped copies, with the documents as they arrived."""
+    return [
+        {**f, "doc": {k: v for k, v in f["doc"].items() if k != "_doc_hash"}}
+        if isinstance(f.get("doc"), dict) and "_doc_hash" in f["doc"] else f
+        for f in failures
+    ]
+
+class BloomFilter:
+    """
+    Bloom filter over hex digests. Sized for `capacity` items at `fp_rate`; once full it is
+    cleared, which only costs extra inserts that the unique index then rejects.
+    """
+
+    def __init__(self, capacity=None, fp_rate=None):
+        self.capacity = capacity or BLOOM_CAPACITY
+        fp_rate = fp_rate or BLOOM_FP_RATE
+        self.m = max(8, int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / self.capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, h):
+        # double hashing from the digest itself; it is already uniformly distributed
+        a, b = int(h[:16], 16), int(h[16:32], 16) | 1
+        return [(a + i * b) % self.m for i in range(self.k)]
+
+    def add(self, h):
+        if self.count >= self.capacity:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+        for p in self._positions(h):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, h):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h))
+
+class DocDeduper:
+    def __init__(self, router, bloom=None, cross_partition=False):
+        self.router = router
+        self.bloom = bloom if bloom is not None else BloomFilter()
+        # partitioned raw_data: the unique index does not span partitions, so confirm every hash
+        self.cross_partition = cross_partition
+
+    def filter(self, docs):
+        """
+        Split docs (already stamped with _doc_hash) into (to_insert, skipped): copies within the
+        batch and documents confirmed to be stored already are skipped.
+        """
+        seen, candidates, maybe = set(), [], set()
+        skipped = 0
+        for d in docs:
+            h = d.get("_doc_hash")
+            if h is None:
+                candidates.append(d)
+                continue
+            if h in seen:
+                skipped += 1
+                continue
+            seen.add(h)
+            candidates.append(d)
+            if self.cross_partition or h in self.bloom:
+                maybe.add(h)
+        if not maybe:
+            return candidates, skipped
+        stored = {
+            d["_doc_hash"]
+            for d in self.router.find({"_doc_hash": {"$in": list(maybe)}}, {"_doc_hash": 1, "_id": 0})
+        }
+        to_insert = [d for d in candidates if d.get("_doc_hash") not in stored]
+        return to_insert, skipped + len(candidates) - len(to_insert)
+
+    def remember(self, docs):
+        for d in docs:
+            h = d.get("_doc_hash")
+            if h is not None:
+                self.bloom.add(h)
@@ -1,18 +1,536 @@
 # backend/app/dlq.py
-import redis, os, orjson
-from datetime import datetime
+"""
+Dead letter queue on a Redis Stream.
+
+Every entry is XADDed to DLQ_STREAM, so its ID sorts by time, with the fields reason, ts and
+payload (orjson). A sorted set per reason (<DLQ_NAME>:reason:<reason>) indexes the entry IDs.
+All members have score 0 and are zero-padded, so lexicographic order is time order and
+ZRANGEBYLEX pages a reason in O(log N + page). <DLQ_NAME>:reasons lists the reasons seen.
+
+Listing goes through cursors (the last entry ID of the previous page), never through the whole
+queue, so inspecting the DLQ costs the same at 10 or 10 million entries.
+
+Failures are dead-lettered per group, not per document: send_failures() writes one entry per
+(job, schema version, reason) holding the count, per-detail counts, one sample document per
+detail and references to the failed documents (the first DLQ_MAX_DOCS in full, the rest as
+{"id", "reason"} stubs), zlib-compressed in chunks of DLQ_CHUNK_DOCS under
+<DLQ_NAME>:payload:<ref> (written in one MULTI with the entry, so no chunk outlives a failed
+XADD; chunks go when their entry is removed or spilled). The group hash (<DLQ_NAME>:group:<job>:<version>:<reason>) and
+<DLQ_NAME>:counts (documents currently dead-lettered per reason) are kept with HINCRBY.
+
+The Redis tier is bounded: once the stream holds more than DLQ_MAX_ENTRIES entries or its
+entries and chunks more than DLQ_MAX_BYTES, the oldest entries are spilled, DLQ_SPILL_BATCH at a
+time, with their documents inlined, to the cold tier (dlq_spill: compressed segment files or a
+Mongo collection) until it is back under DLQ_SPILL_LOW_WATER of the caps. Spilled entries are
+always older than the ones in Redis; list_entries, entries_failures and remove_entries read and
+write both tiers, so the API, the scripts, replay and revalidation do not need to care.
+"""
+import redis, os, orjson, uuid, zlib
+from collections import Counter
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException
+from .dlq_spill import get_spill
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 DLQ_NAME = os.getenv("DLQ_NAME", "chrysalis:dlq")
+DLQ_STREAM = os.getenv("DLQ_STREAM", f"{DLQ_NAME}:stream")
+DLQ_PAGE_MAX = 500
+DLQ_SAMPLE_SIZE = int(os.getenv("DLQ_SAMPLE_SIZE", "3"))
+DLQ_SAMPLE_BYTES = int(os.getenv("DLQ_SAMPLE_BYTES", "4096"))
+DLQ_CHUNK_DOCS = int(os.getenv("DLQ_CHUNK_DOCS", "5000"))
+DLQ_MAX_DOCS = int(os.getenv("DLQ_MAX_DOCS", "1000"))
+DLQ_GROUP_TTL_SECS = int(os.getenv("DLQ_GROUP_TTL_SECS", str(7 * 86400)))
+DLQ_MAX_ENTRIES = int(os.getenv("DLQ_MAX_ENTRIES", "100000"))
+DLQ_MAX_BYTES = int(os.getenv("DLQ_MAX_BYTES", str(256 * 1024 * 1024)))
+DLQ_SPILL_BATCH = int(os.getenv("DLQ_SPILL_BATCH", "1000"))
+DLQ_SPILL_LOW_WATER = float(os.getenv("DLQ_SPILL_LOW_WATER", "0.9"))
 r = redis.from_url(REDIS_URL, decode_responses=False)
 
-def send_to_dlq(payload, reason="unknown"):
-    msg = {
-        "payload": payload,
-        "reason": reason,
-        "timestamp": datetime.utcnow().isoformat()
+router = APIRouter(prefix="/dlq", tags=["dlq"])
+
+def _reason_key(reason):
+    return f"{DLQ_NAME}:reason:{reason}"
+
+def _reasons_key():
+    return f"{DLQ_NAME}:reasons"
+
+def _counts_key():
+    return f"{DLQ_NAME}:counts"
+
+def _group_key(group_id):
+    return f"{DLQ_NAME}:group:{group_id}"
+
+def _payload_key(ref):
+    return f"{DLQ_NAME}:payload:{ref}"
+
+def _bytes_key():
+    return f"{DLQ_NAME}:bytes"
+
+def _spilled_key():
+    return f"{DLQ_NAME}:spilled"
+
+def last_entry_ms():
+    """
+    Redis time (epoch ms) of the newest entry ID the stream has handed out, deleted or spilled
+    entries included; None if nothing was ever dead-lettered. A cutoff on the stream's own clock.
+    """
+    try:
+        last = r.xinfo_stream(DLQ_STREAM)["last-generated-id"]
+    except redis.ResponseError:
+        return None
+    return int((last.decode() if isinstance(last, bytes) else last).partition("-")[0])
+
+def _lex(entry_id):
+    """Stream ID "ms-seq" as a fixed-width member whose lexicographic order is time order."""
+    ms, _, seq = entry_id.partition("-")
+    return f"{int(ms):015d}-{int(seq or 0):020d}"
+
+def _unlex(member):
+    ms, _, seq = member.partition("-")
+    return f"{int(ms)}-{int(seq)}"
+
+def _ms(ts):
+    if not isinstance(ts, datetime):
+        return int(ts)
+    if ts.tzinfo is None:
+        # naive datetimes are UTC throughout the pipeline
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp() * 1000)
+
+def send_to_dlq(payload, reason="unknown", count=1, chunks=None):
+    """
+    Add one entry. chunks ({ref: compressed failures}) are the payload chunks it references;
+    they are written in the same MULTI as the entry, so neither exists without the other.
+    """
+    ts = datetime.utcnow().isoformat()
+    chunks = chunks or {}
+    try:
+        # default=str: failed inserts can carry BSON values such as a user-supplied ObjectId
+        body = orjson.dumps(payload, default=str)
+        # counted against DLQ_MAX_BYTES: the entry plus the payload chunks it references
+        size = len(body) + len(reason) + len(ts) + sum(len(c) for c in chunks.values())
+        pipe = r.pipeline(transaction=bool(chunks))
+        for ref, chunk in chunks.items():
+            pipe.set(_payload_key(ref), chunk)
+        pipe.xadd(DLQ_STREAM, {
+            "reason": reason,
+            "ts": ts,
+            "payload": body,
+            "bytes": size,
+        })
+        entry_id = pipe.execute()[-1].decode()
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(_reason_key(reason), {_lex(entry_id): 0})
+        pipe.sadd(_reasons_key(), reason)
+        # count: documents the entry stands for
+        pipe.hincrby(_counts_key(), reason, count)
+        pipe.incrby(_bytes_key(), size)
+        pipe.xlen(DLQ_STREAM)
+        *_, total_bytes, entries = pipe.execute()
+    except Exception as e:
+        print("DLQ push failed:", e)
+        return None
+    if entries > DLQ_MAX_ENTRIES or total_bytes > DLQ_MAX_BYTES:
+        try:
+            spill_oldest()
+        except Exception as e:
+            print("DLQ spill failed:", e)
+    return entry_id
+
+def _sample(failures):
+    """One document per detail reason, for up to DLQ_SAMPLE_SIZE reasons."""
+    first = {}
+    for f in failures:
+        if len(first) >= DLQ_SAMPLE_SIZE:
+            break
+        if "doc" in f:
+            first.setdefault(f.get("reason"), f["doc"])
+    out = []
+    for doc in first.values():
+        size = len(orjson.dumps(doc, default=str))
+        out.append(doc if size <= DLQ_SAMPLE_BYTES else {"_truncated_bytes": size})
+    return out
+
+def _stub(failure, position):
+    """A failure without its document: the doc's _id (or id), else its position in the group."""
+    doc = failure.get("doc")
+    doc_id = doc.get("_id", doc.get("id")) if isinstance(doc, dict) else None
+    return {"id": doc_id if doc_id is not None else position, "reason": failure.get("reason")}
+
+def send_failures(failures, reason, job_id="unknown", schema_version=None, source=None):
+    """
+    Dead-letter failures ([{"doc", "reason"}, ...]) of one job as a single entry of the group
+    (job_id, schema_version, reason). The first DLQ_MAX_DOCS documents are kept in full; the
+    rest as {"id", "reason"} stubs, so a job failing wholesale costs its counts and ids, not its
+    documents. Returns the entry ID (None if nothing was written).
+    """
+    if not failures:
+        return None
+    group_id = f"{job_id}:{schema_version}:{reason}"
+    details = Counter(f.get("reason") or reason for f in failures)
+    now = datetime.utcnow().isoformat()
+    kept, stored = 0, []
+    for i, f in enumerate(failures):
+        if "doc" not in f:
+            # already a stub (replayed or revalidated again)
+            stored.append(f)
+        elif kept < DLQ_MAX_DOCS:
+            stored.append(f)
+            kept += 1
+        else:
+            stored.append(_stub(f, i))
+    chunks = {
+        uuid.uuid4().hex: zlib.compress(orjson.dumps(stored[i:i + DLQ_CHUNK_DOCS], default=str))
+        for i in range(0, len(stored), DLQ_CHUNK_DOCS)
     }
     try:
-        r.lpush(DLQ_NAME, orjson.dumps(msg))
+        pipe = r.pipeline(transaction=False)
+        gkey = _group_key(group_id)
+        pipe.hincrby(gkey, "count", len(failures))
+        for detail, n in details.items():
+            pipe.hincrby(gkey, f"reason:{detail}", n)
+        pipe.hset(gkey, mapping={"job_id": str(job_id), "schema_version": str(schema_version), "reason": reason, "last_ts": now})
+        pipe.hsetnx(gkey, "first_ts", now)
+        pipe.expire(gkey, DLQ_GROUP_TTL_SECS)
+        pipe.execute()
     except Exception as e:
         print("DLQ push failed:", e)
+        return None
+    return send_to_dlq({
+        "group": group_id,
+        "job_id": job_id,
+        "schema_version": schema_version,
+        "source": source,
+        "count": len(failures),
+        "reasons": dict(details),
+        "docs_kept": kept,
+        "sample": _sample(failures),
+        "refs": list(chunks),
+    }, reason=reason, count=len(failures), chunks=chunks)
+
+def load_payload(ref):
+    blob = r.get(_payload_key(ref))
+    return orjson.loads(zlib.decompress(blob)) if blob is not None else None
+
+def entries_failures(items):
+    """
+    Every failure ([{"doc", "reason"}, ...]) each entry from list_entries stands for, aligned
+    with items; the payload chunks of all entries come back in one MGET.
+    """
+    refs = [ref for item in items for ref in _refs(item)]
+    blobs = dict(zip(refs, r.mget([_payload_key(ref) for ref in refs]))) if refs else {}
+    out = []
+    for item in items:
+        payload = item["payload"]
+        if "_failures" in item:
+            # spilled entries carry their documents
+            out.append(item["_failures"])
+        elif _refs(item):
+            fails = []
+            for ref in _refs(item):
+                if blobs.get(ref) is not None:
+                    fails.extend(orjson.loads(zlib.decompress(blobs[ref])))
+            out.append(fails)
+        elif isinstance(payload, dict) and "doc" in payload:
+            # single-document entries written by send_to_dlq directly
+            out.append([payload])
+        else:
+            out.append([{"doc": payload, "reason": item["reason"]}])
+    return out
+
+def entry_failures(item):
+    return entries_failures([item])[0]
+
+def get_entry(entry_id):
+    rows = r.xrange(DLQ_STREAM, min=entry_id, max=entry_id, count=1)
+    if rows:
+        return _decode(*rows[0])
+    if not _has_spilled():
+        return None
+    spilled = get_spill().list(lo=_lex(entry_id), hi=_lex(entry_id), n=1)
+    return spilled[0] if spilled else None
+
+def _refs(item):
+    payload = item["payload"]
+    return (payload.get("refs") or []) if isinstance(payload, dict) else []
+
+def _entry_count(item):
+    return item["payload"].get("count", 1) if _refs(item) else 1
+
+def _decode(entry_id, fields):
+    entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+    fields = {k.decode(): v for k, v in fields.items()}
+    try:
+        payload = orjson.loads(fields.get("payload", b"null"))
+    except orjson.JSONDecodeError:
+        payload = fields.get("payload", b"").decode(errors="replace")
+    return {
+        "id": entry_id,
+        "reason": fields.get("reason", b"").decode(),
+        "timestamp": fields.get("ts", b"").decode(),
+        "payload": payload,
+        "bytes": int(fields.get("bytes", 0)),
+        "tier": "redis",
+    }
+
+def public_entry(item):
+    """An entry without the fields only the tiers use (_key, the inlined _failures)."""
+    return {k: v for k, v in item.items() if not k.startswith("_")}
+
+def _list_redis(reason, lo, hi, cursor, n, newest_first):
+    """Up to n entries of the Redis tier; lo/hi are stream IDs or "-"/"+", cursor exclusive."""
+    if reason is None:
+        if newest_first:
+            if cursor:
+                hi = f"({cursor}"
+            rows = r.xrevrange(DLQ_STREAM, max=hi, min=lo, count=n)
+        else:
+            if cursor:
+                lo = f"({cursor}"
+            rows = r.xrange(DLQ_STREAM, min=lo, max=hi, count=n)
+        return [_decode(i, f) for i, f in rows]
+    zlo = f"[{_lex(lo)}" if lo != "-" else "-"
+    zhi = f"[{_lex(hi)}" if hi != "+" else "+"
+    items = []
+    while len(items) < n:
+        if newest_first:
+            if cursor:
+                zhi = f"({_lex(cursor)}"
+            members = r.zrevrangebylex(_reason_key(reason), zhi, zlo, start=0, num=n - len(items))
+        else:
+            if cursor:
+                zlo = f"({_lex(cursor)}"
+            members = r.zrangebylex(_reason_key(reason), zlo, zhi, start=0, num=n - len(items))
+        if not members:
+            break
+        ids = [_unlex(m.decode()) for m in members]
+        pipe = r.pipeline(transaction=False)
+        for i in ids:
+            pipe.xrange(DLQ_STREAM, min=i, max=i, count=1)
+        # index members whose entry was deleted from the stream are skipped
+        items.extend(_decode(rows[0][0], rows[0][1]) for rows in pipe.execute() if rows)
+        cursor = ids[-1]
+    return items
+
+def _has_spilled(reason=None):
+    """Whether the cold tier holds any entries (of reason), from the <DLQ_NAME>:spilled counters."""
+    if reason is not None:
+        return int(r.hget(_spilled_key(), reason) or 0) > 0
+    return any(int(v) > 0 for v in r.hvals(_spilled_key()))
+
+def list_entries(reason=None, since=None, until=None, cursor=None, limit=50, newest_first=False):
+    """
+    One page of DLQ entries, oldest first (or newest_first), from the spilled tier and Redis.
+    since/until are datetimes (UTC) or epoch ms; cursor is the "next_cursor" of the previous
+    page. Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), DLQ_PAGE_MAX))
+    lo = f"{_ms(since)}-0" if since is not None else "-"
+    hi = f"{_ms(until)}-18446744073709551615" if until is not None else "+"
+
+    def spilled(n):
+        if not has_spilled:
+            return []
+        return get_spill().list(
+            reason,
+            _lex(lo) if lo != "-" else None,
+            _lex(hi) if hi != "+" else None,
+            _lex(cursor) if cursor else None,
+            n,
+            newest_first,
+        )
+
+    def redis_tier(n):
+        return _list_redis(reason, lo, hi, cursor, n, newest_first)
+
+    # nothing spilled (the usual case): the cold tier is not touched at all
+    has_spilled = _has_spilled(reason)
+    # spilled entries are all older than the ones still in Redis
+    items = []
+    for tier in ((redis_tier, spilled) if newest_first else (spilled, redis_tier)):
+        items.extend(tier(limit + 1 - len(items)))
+        if len(items) > limit:
+            break
+    if len(items) > limit:
+        items = items[:limit]
+        return items, items[-1]["id"]
+    return items, None
+
+def spill_oldest():
+    """
+    Move the oldest entries to the cold tier until the Redis tier is under DLQ_SPILL_LOW_WATER
+    of its caps. One worker spills at a time; returns the number of entries spilled.
+    """
+    lock = f"{DLQ_NAME}:spill_lock"
+    if not r.set(lock, 1, nx=True, ex=60):
+        return 0
+    spilled = 0
+    try:
+        while True:
+            entries, total_bytes = r.xlen(DLQ_STREAM), int(r.get(_bytes_key()) or 0)
+            if entries <= DLQ_MAX_ENTRIES * DLQ_SPILL_LOW_WATER and total_bytes <= DLQ_MAX_BYTES * DLQ_SPILL_LOW_WATER:
+                return spilled
+            items = [_decode(i, f) for i, f in r.xrange(DLQ_STREAM, count=DLQ_SPILL_BATCH)]
+            if not items:
+                return spilled
+            cold = [
+                {**item, "tier": "spilled", "_key": _lex(item["id"]), "_failures": fails}
+                for item, fails in zip(items, entries_failures(items))
+            ]
+            # written out before anything leaves Redis
+            _spill_batch(cold)
+            pipe = r.pipeline(transaction=False)
+            pipe.xdel(DLQ_STREAM, *[e["id"] for e in items])
+            for e in items:
+                pipe.zrem(_reason_key(e["reason"]), _lex(e["id"]))
+                pipe.hincrby(_spilled_key(), e["reason"], 1)
+                pipe.decrby(_bytes_key(), e["bytes"])
+                for ref in _refs(e):
+                    pipe.delete(_payload_key(ref))
+            pipe.expire(lock, 60)
+            pipe.execute()
+            spilled += len(items)
+    finally:
+        r.delete(lock)
+
+def _spill_batch(cold):
+    """
+    Write cold entries to the cold tier. If the batch fails, the entries are written one by one
+    and one whose documents cannot be written goes without them (spill_error says why), so a
+    bad entry cannot pin the oldest batch in Redis. If even that fails the tier is down and the
+    error propagates.
+    """
+    try:
+        get_spill().write(cold)
+        return
+    except Exception as e:
+        print("DLQ spill batch failed, spilling entries one at a time:", e)
+    for e in cold:
+        try:
+            get_spill().write([e])
+        except Exception as err:
+            print(f"DLQ spill of {e['id']} failed ({err}); spilling it without its documents")
+            get_spill().write([{**e, "_failures": [], "spill_error": str(err)}])
+
+def dlq_stats():
+    reasons = sorted(m.decode() for m in r.smembers(_reasons_key()))
+    pipe = r.pipeline(transaction=False)
+    pipe.xlen(DLQ_STREAM)
+    pipe.get(_bytes_key())
+    for reason in reasons:
+        pipe.zcard(_reason_key(reason))
+    pipe.hgetall(_counts_key())
+    pipe.hgetall(_spilled_key())
+    in_redis, redis_bytes, *counts, docs, spilled = pipe.execute()
+    spilled = {k.decode(): int(v) for k, v in spilled.items()}
+    return {
+        "total": in_redis + sum(spilled.values()),
+        "by_reason": {reason: n + spilled.get(reason, 0) for reason, n in zip(reasons, counts)},
+        "docs_by_reason": {k.decode(): int(v) for k, v in docs.items() if int(v) > 0},
+        "redis_entries": in_redis,
+        "redis_bytes": int(redis_bytes or 0),
+        "spilled_entries": sum(spilled.values()),
+    }
+
+def group_stats(group_id):
+    """Counters of one (job, schema version, reason) group; None once it expired."""
+    fields = {k.decode(): v.decode() for k, v in r.hgetall(_group_key(group_id)).items()}
+    if not fields:
+        return None
+    details = {k[len("reason:"):]: int(v) for k, v in fields.items() if k.startswith("reason:")}
+    out = {k: v for k, v in fields.items() if not k.startswith("reason:")}
+    out["count"] = int(out.get("count", 0))
+    out["reasons"] = details
+    return out
+
+def remove_entries(entries):
+    """Delete entries (dicts from list_entries) from whichever tier holds them."""
+    if not entries:
+        return 0
+    hot = [e for e in entries if e.get("tier") != "spilled"]
+    cold = [e for e in entries if e.get("tier") == "spilled"]
+    removed = get_spill().remove([e["_key"] for e in cold]) if cold else 0
+    pipe = r.pipeline(transaction=False)
+    if hot:
+        pipe.xdel(DLQ_STREAM, *[e["id"] for e in hot])
+    for e in hot:
+        pipe.zrem(_reason_key(e["reason"]), _lex(e["id"]))
+        pipe.decrby(_bytes_key(), e.get("bytes", 0))
+        for ref in _refs(e):
+            pipe.delete(_payload_key(ref))
+    for e in cold:
+        pipe.hincrby(_spilled_key(), e["reason"], -1)
+    for e in entries:
+        pipe.hincrby(_counts_key(), e["reason"], -_entry_count(e))
+    results = pipe.execute()
+    return removed + (results[0] if hot else 0)
+
+def migrate_legacy_list():
+    """Move entries of the old LPUSH list (DLQ_NAME) into the stream, oldest first."""
+    moved = 0
+    if r.type(DLQ_NAME) != b"list":
+        return moved
+    while True:
+        item = r.rpop(DLQ_NAME)
+        if item is None:
+            return moved
+        try:
+            msg = orjson.loads(item)
+            send_to_dlq(msg.get("payload"), reason=msg.get("reason", "unknown"))
+        except (orjson.JSONDecodeError, AttributeError):
+            send_to_dlq(item.decode(errors="replace"), reason="legacy_unparseable")
+        moved += 1
+
+def _parse_time(value, name):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO timestamp")
+
+@router.get("")
+def get_dlq(reason: str = None, since: str = None, until: str = None, cursor: str = None,
+            limit: int = 50, newest_first: bool = False):
+    items, next_cursor = list_entries(
+        reason=reason,
+        since=_parse_time(since, "since"),
+        until=_parse_time(until, "until"),
+        cursor=cursor,
+        limit=limit,
+        newest_first=newest_first,
+    )
+    return {"items": [public_entry(i) for i in items], "next_cursor": next_cursor}
+
+@router.get("/stats")
+def get_dlq_stats():
+    return dlq_stats()
+
+@router.post("/replay")
+def post_dlq_replay(reason: str = None, since: str = None, until: str = None, entry_id: str = None,
+                    max_entries: int = 1000, dry_run: bool = False):
+    # imported here: dlq_replay builds on this module
+    from .dlq_replay import replay, replay_entries
+    try:
+        if entry_id:
+            entry = get_entry(entry_id)
+            if entry is None:
+                raise HTTPException(status_code=404, detail="entry not found")
+            return replay_entries([entry], dry_run=dry_run)
+        return replay(
+            reason=reason,
+            since=_parse_time(since, "since"),
+            until=_parse_time(until, "until"),
+            max_entries=max_entries,
+            dry_run=dry_run,
+            progress=None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/groups/{group_id:path}")
+def get_dlq_group(group_id: str):
+    group = group_stats(group_id)
+    if group is None:
+        raise HTTPException(status_code=404, detail="group not found")
+    return group
@@ -0,0 +1,136 @@
+# backend/app/dlq_replay.py
+"""
+Replay dead-lettered documents.
+
+Entries are read a page at a time (their payload chunks with one MGET per page), filtered by
+reason and time, and every document is validated locally against the active compiled schema
+before anything is enqueued. Documents that pass are rebuilt into proper ingest jobs
+({"job_id", "source", "documents"}, REPLAY_JOB_DOCS per job) and LPUSHed the way /ingest does,
+at most `rate` documents per second. Documents that still fail are dead-lettered again under
+the current schema version; replayed entries are then removed from the DLQ.
+"""
+import os, time, uuid, orjson, redis
+from datetime import datetime
+from .dlq import list_entries, entries_failures, remove_entries, send_failures
+from .versioning import get_latest_schema_meta
+from .validator import compile_schema
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+QUEUE_NAME = os.getenv("QUEUE_NAME", "chrysalis:ingest:queue")
+REPLAY_BATCH = int(os.getenv("REPLAY_BATCH", "100"))
+REPLAY_JOB_DOCS = int(os.getenv("REPLAY_JOB_DOCS", "1000"))
+REPLAY_RATE = float(os.getenv("REPLAY_RATE", "0"))
+
+# entries whose documents can go through the pipeline again; invalid_job_payload and
+# empty_documents hold no documents
+REPLAY_REASONS = ("validation_failed", "insert_failed")
+
+r = redis.from_url(REDIS_URL, decode_responses=False)
+
+class _RateLimiter:
+    """Sleeps so that no more than `rate` documents per second are sent (0: no limit)."""
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.sent = 0
+
+    def wait(self, n):
+        self.sent += n
+        if self.rate > 0:
+            ahead = self.sent / self.rate - (time.monotonic() - self.start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+def _active_validator():
+    meta = get_latest_schema_meta()
+    if not meta or not meta.get("schema"):
+        # nothing to validate against yet: the worker infers and promotes one
+        return None, lambda doc: (True, None)
+    return meta["version"], compile_schema(meta["schema"], meta.get("schema_hash")).validate
+
+def replay_entries(items, validator=None, limiter=None, dry_run=False, stats=None):
+    """Replay one page of entries (dicts from list_entries); returns the updated stats."""
+    stats = stats if stats is not None else {"entries": 0, "docs": 0, "requeued": 0, "jobs": 0, "still_failing": 0, "skipped": 0}
+    version, validate = validator or _active_validator()
+    limiter = limiter or _RateLimiter(REPLAY_RATE)
+    passed, still, done = {}, {}, []
+    for item, fails in zip(items, entries_failures(items)):
+        if item["reason"] not in REPLAY_REASONS:
+            stats["skipped"] += 1
+            continue
+        payload = item["payload"] if isinstance(item["payload"], dict) else {}
+        job_id = payload.get("job_id", "unknown")
+        source = payload.get("source") or "unknown"
+        for f in fails:
+            stats["docs"] += 1
+            if "doc" not in f:
+                # only the id was kept (past DLQ_MAX_DOCS): nothing to replay
+                still.setdefault((item["reason"], job_id, source), []).append(f)
+                continue
+            doc = f.get("doc")
+            ok, why = validate(doc) if isinstance(doc, dict) else (False, "not_a_document")
+            if ok:
+                passed.setdefault((source, job_id), []).append(doc)
+            else:
+                still.setdefault((item["reason"], job_id, source), []).append({"doc": doc, "reason": why})
+        done.append(item)
+        stats["entries"] += 1
+    pipe = r.pipeline(transaction=False)
+    for (source, job_id), docs in passed.items():
+        for i in range(0, len(docs), REPLAY_JOB_DOCS):
+            chunk = docs[i:i + REPLAY_JOB_DOCS]
+            if not dry_run:
+                pipe.lpush(QUEUE_NAME, orjson.dumps({
+                    "job_id": str(uuid.uuid4()),
+                    "source": source,
+                    "received_at": datetime.utcnow().isoformat(),
+                    "replay_of": job_id,
+                    "documents": chunk,
+                }, default=str))
+                if limiter.rate > 0:
+                    pipe.execute()
+                    limiter.wait(len(chunk))
+            stats["requeued"] += len(chunk)
+            stats["jobs"] += 1
+    if dry_run:
+        stats["still_failing"] += sum(len(f) for f in still.values())
+        return stats
+    pipe.execute()
+    # jobs are queued before their entries go, so a crash in between replays twice, never loses
+    for (reason, job_id, source), fails in still.items():
+        send_failures(fails, reason, job_id, version, source)
+        stats["still_failing"] += len(fails)
+    remove_entries(done)
+    return stats
+
+def replay(reason=None, since=None, until=None, max_entries=None, rate=None, batch_size=None,
+           dry_run=False, progress=print, progress_every=5.0):
+    """
+    Replay DLQ entries of `reason` (default: every replayable reason) dead-lettered between
+    since and until. Entries added while replaying (documents failing again) are not revisited.
+    Returns {"entries", "docs", "requeued", "jobs", "still_failing", "skipped", "docs_per_sec"}.
+    """
+    if reason is not None and reason not in REPLAY_REASONS:
+        raise ValueError(f"{reason!r} entries hold no documents to replay; use one of {', '.join(REPLAY_REASONS)}")
+    # stop at what is in the DLQ now
+    until = min(until, datetime.utcnow()) if until else datetime.utcnow()
+    batch_size = batch_size or REPLAY_BATCH
+    validator = _active_validator()
+    limiter = _RateLimiter(REPLAY_RATE if rate is None else rate)
+    stats = {"entries": 0, "docs": 0, "requeued": 0, "jobs": 0, "still_failing": 0, "skipped": 0}
+    started = last_report = time.monotonic()
+    for name in ([reason] if reason else REPLAY_REASONS):
+        cursor = None
+        while max_entries is None or stats["entries"] < max_entries:
+            limit = batch_size if max_entries is None else min(batch_size, max_entries - stats["entries"])
+            items, cursor = list_entries(reason=name, since=since, until=until, cursor=cursor, limit=limit)
+            replay_entries(items, validator, limiter, dry_run, stats)
+            if progress and time.monotonic() - last_report >= progress_every:
+                last_report = time.monotonic()
+                rate_now = stats["docs"] / (last_report - started)
+                progress(f"[replay] {stats['entries']} entries, {stats['docs']} docs: {stats['requeued']} requeued, {stats['still_failing']} still failing ({rate_now:,.0f} docs/s)")
+            if cursor is None:
+                break
+    elapsed = time.monotonic() - started
+    stats["docs_per_sec"] = round(stats["docs"] / elapsed, 1) if elapsed > 0 else None
+    return stats
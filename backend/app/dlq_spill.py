@@ -0,0 +1,215 @@
+# backend/app/dlq_spill.py
+"""
+Cold tier of the DLQ: entries spilled out of Redis once the DLQ is over its cap (see dlq.py).
+
+Spilled entries are self-contained: the failed documents their payload chunks referenced are
+inlined under "_failures". Every entry carries "_key", its fixed-width stream ID (dlq._lex),
+so keys compare in time order, as in the Redis tier.
+
+  MongoSpill     the dlq_archive collection, _id = key (indexed by reason and key); the inlined
+                 failures are stored gzip-compressed, split over dlq_archive_parts documents
+                 when they do not fit DLQ_SPILL_PART_BYTES (Mongo caps documents at 16 MB).
+                 The default with STORAGE_BACKEND=mongo: the API and the worker both reach it.
+  SegmentSpill   gzip NDJSON segment files under DLQ_SPILL_DIR, one per spilled batch, named
+                 <first key>_<last key>.ndjson.gz so that listing can skip whole segments. Every
+                 process that serves the DLQ must see the same directory (a shared volume);
+                 writers and readers take a flock on DLQ_SPILL_DIR/.lock. The default with an
+                 embedded STORAGE_BACKEND, so the DLQ needs no Mongo either
+
+Both take entries in key order and answer list(reason, lo, hi, cursor, n, newest_first) with
+up to n entries; lo/hi are inclusive key bounds and cursor an exclusive key (all may be None).
+"""
+import os, gzip, fcntl, orjson
+from contextlib import contextmanager
+from pymongo import ASCENDING, ReplaceOne
+from .mongo import mongo_db
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# the cold tier follows the raw data: Mongo with Mongo, segment files with sqlite/duckdb
+DLQ_SPILL_TARGET = os.getenv("DLQ_SPILL_TARGET", "mongo" if STORAGE_BACKEND == "mongo" else "disk")
+DLQ_SPILL_DIR = os.getenv("DLQ_SPILL_DIR", "./dlq_spill")
+DLQ_SPILL_PART_BYTES = int(os.getenv("DLQ_SPILL_PART_BYTES", str(8 * 1024 * 1024)))
+DLQ_ARCHIVE_COLLECTION = "dlq_archive"
+DLQ_ARCHIVE_PARTS_COLLECTION = "dlq_archive_parts"
+
+_SUFFIX = ".ndjson.gz"
+
+def _in_range(key, lo, hi, cursor, newest_first):
+    if lo is not None and key < lo:
+        return False
+    if hi is not None and key > hi:
+        return False
+    if cursor is not None and (key >= cursor if newest_first else key <= cursor):
+        return False
+    return True
+
+class SegmentSpill:
+    def __init__(self, root=None):
+        self.root = root or DLQ_SPILL_DIR
+        os.makedirs(self.root, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        # segment rewrites delete and recreate files; other processes must not see them halfway
+        with open(os.path.join(self.root, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _segments(self, newest_first=False):
+        names = sorted((n for n in os.listdir(self.root) if n.endswith(_SUFFIX)), reverse=newest_first)
+        for name in names:
+            first, _, last = name[:-len(_SUFFIX)].partition("_")
+            yield name, first, last
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.root, name), "rb") as f:
+            return [orjson.loads(line) for line in f if line.strip()]
+
+    def _write(self, entries):
+        name = f"{entries[0]['_key']}_{entries[-1]['_key']}{_SUFFIX}"
+        path = os.path.join(self.root, name)
+        with gzip.open(path + ".tmp", "wb") as f:
+            for e in entries:
+                f.write(orjson.dumps(e, default=str))
+                f.write(b"\n")
+        os.replace(path + ".tmp", path)
+        return name
+
+    def write(self, entries):
+        if not entries:
+            return None
+        with self._locked(True):
+            return self._write(entries)
+
+    def list(self, reason=None, lo=None, hi=None, cursor=None, n=50, newest_first=False):
+        with self._locked(False):
+            return self._list(reason, lo, hi, cursor, n, newest_first)
+
+    def _list(self, reason, lo, hi, cursor, n, newest_first):
+        out = []
+        for name, first, last in self._segments(newest_first):
+            # whole segments outside the bounds are never opened
+            if (lo is not None and last < lo) or (hi is not None and first > hi):
+                continue
+            if cursor is not None and (first >= cursor if newest_first else last <= cursor):
+                continue
+            entries = self._read(name)
+            for e in reversed(entries) if newest_first else entries:
+                if (reason is None or e["reason"] == reason) and _in_range(e["_key"], lo, hi, cursor, newest_first):
+                    out.append(e)
+                    if len(out) >= n:
+                        return out
+        return out
+
+    def remove(self, keys):
+        """Drop entries by key, rewriting (or deleting) the segments that held them."""
+        keys = set(keys)
+        with self._locked(True):
+            return self._remove(keys)
+
+    def _remove(self, keys):
+        removed = 0
+        for name, first, last in list(self._segments()):
+            if not any(first <= k <= last for k in keys):
+                continue
+            entries = self._read(name)
+            kept = [e for e in entries if e["_key"] not in keys]
+            if len(kept) == len(entries):
+                continue
+            removed += len(entries) - len(kept)
+            os.remove(os.path.join(self.root, name))
+            if kept:
+                self._write(kept)
+        return removed
+
+    def size_bytes(self):
+        with self._locked(False):
+            return sum(os.path.getsize(os.path.join(self.root, name)) for name, _, _ in self._segments())
+
+class MongoSpill:
+    def __init__(self, collection=None, parts=None):
+        db = mongo_db() if collection is None or parts is None else None
+        self.coll = collection if collection is not None else db[DLQ_ARCHIVE_COLLECTION]
+        self.parts = parts if parts is not None else db[DLQ_ARCHIVE_PARTS_COLLECTION]
+        self.coll.create_index([("reason", ASCENDING), ("_id", ASCENDING)])
+        self.parts.create_index([("key", ASCENDING)])
+
+    def write(self, entries):
+        """Upserts throughout, so a batch retried after a partial write goes through."""
+        if not entries:
+            return 0
+        docs, parts = [], []
+        for e in entries:
+            doc = {k: v for k, v in e.items() if k != "_failures"}
+            doc["_id"] = e["_key"]
+            blob = gzip.compress(orjson.dumps(e.get("_failures") or [], default=str))
+            if len(blob) <= DLQ_SPILL_PART_BYTES:
+                doc["_failures_gz"], doc["_parts"] = blob, 0
+            else:
+                chunks = [blob[i:i + DLQ_SPILL_PART_BYTES] for i in range(0, len(blob), DLQ_SPILL_PART_BYTES)]
+                doc["_parts"] = len(chunks)
+                parts += [
+                    ReplaceOne({"_id": f"{e['_key']}:{i:05d}"}, {"key": e["_key"], "data": c}, upsert=True)
+                    for i, c in enumerate(chunks)
+                ]
+            docs.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        # parts first: an entry is never visible without its documents
+        if parts:
+            self.parts.bulk_write(parts, ordered=False)
+        self.coll.bulk_write(docs, ordered=False)
+        return len(entries)
+
+    def _inflate(self, docs):
+        split = [d["_id"] for d in docs if d.get("_parts")]
+        chunks = {}
+        if split:
+            for p in self.parts.find({"key": {"$in": split}}).sort("_id", 1):
+                chunks.setdefault(p["key"], []).append(p["data"])
+        out = []
+        for d in docs:
+            blob = b"".join(chunks.get(d["_id"], [])) if d.get("_parts") else d.get("_failures_gz")
+            e = {k: v for k, v in d.items() if k not in ("_id", "_failures_gz", "_parts")}
+            e["_failures"] = orjson.loads(gzip.decompress(blob)) if blob else []
+            out.append(e)
+        return out
+
+    def list(self, reason=None, lo=None, hi=None, cursor=None, n=50, newest_first=False):
+        key = {}
+        if lo is not None:
+            key["$gte"] = lo
+        if hi is not None:
+            key["$lte"] = hi
+        if cursor is not None:
+            key["$lt" if newest_first else "$gt"] = cursor
+        flt = {"_id": key} if key else {}
+        if reason is not None:
+            flt["reason"] = reason
+        cur = self.coll.find(flt).sort("_id", -1 if newest_first else 1).limit(n)
+        return self._inflate(list(cur))
+
+    def remove(self, keys):
+        keys = list(keys)
+        removed = self.coll.delete_many({"_id": {"$in": keys}}).deleted_count
+        self.parts.delete_many({"key": {"$in": keys}})
+        return removed
+
+    def size_bytes(self):
+        stats = [self.coll.database.command("collStats", c.name) for c in (self.coll, self.parts)]
+        return sum(s.get("storageSize", 0) for s in stats)
+
+_spills = {}
+
+def get_spill(name=None):
+    """The cold tier name (default DLQ_SPILL_TARGET; disk|mongo), created on first use."""
+    name = name or DLQ_SPILL_TARGET
+    if name not in _spills:
+        if name == "mongo":
+            _spills[name] = MongoSpill()
+        elif name == "disk":
+            _spills[name] = SegmentSpill()
+        else:
+            raise ValueError(f"unknown DLQ_SPILL_TARGET {name!r}")
+    return _spills[name]
@@ -0,0 +1,246 @@
+# backend/app/embedded_storage.py
+"""
+Embedded StorageBackends for edge nodes and CI: no Mongo server needed for raw documents.
+
+Both keep one raw_data table: the ingest metadata as columns (schema_version, ingest_job_id,
+ingest_ts, source, doc_hash) and the document itself as JSON text in `body`, queried with JSON1
+(SQLite) or DuckDB's json functions. doc_hash has a unique index, so DEDUPE_DOCS works the same
+way as on Mongo (duplicates are ignored and counted in last_skipped). Writes take a lock: the
+worker loop and DLQ revalidation share one instance and its connection.
+
+duckdb is optional; DuckDBStorage raises at construction without it.
+"""
+import os, sqlite3, threading
+from datetime import datetime, timedelta
+
+import orjson
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+from .storage import StorageBackend
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "chrysalis.db")
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "chrysalis.duckdb")
+
+_META = ("_id", "_schema_version", "_ingest_job_id", "_ingest_ts", "_source", "_doc_hash")
+_COLUMNS = {"_schema_version": "schema_version", "_ingest_job_id": "ingest_job_id", "_source": "source", "_doc_hash": "doc_hash"}
+
+def _rows(docs, meta):
+    """(rows, failed): rows are (schema_version, ingest_job_id, ingest_ts, source, doc_hash, body)."""
+    rows, failed = [], []
+    for d in docs:
+        m = meta or d
+        try:
+            body = orjson.dumps({k: v for k, v in d.items() if k not in _META}, default=str).decode()
+        except orjson.JSONEncodeError as e:
+            failed.append({"doc": d, "reason": f"insert_failed:None:{e}"})
+            continue
+        rows.append((m.get("_schema_version"), m.get("_ingest_job_id"), m.get("_ingest_ts"), m.get("_source"), d.get("_doc_hash"), body))
+    return rows, failed
+
+def _doc(row):
+    id_, version, job_id, ts, source, doc_hash, body = row
+    doc = orjson.loads(body)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    doc.update({"_id": id_, "_schema_version": version, "_ingest_job_id": job_id, "_ingest_ts": ts, "_source": source})
+    if doc_hash is not None:
+        doc["_doc_hash"] = doc_hash
+    return doc
+
+def _bucket_counts(minute_rows, bucket_mins):
+    """Fold (minute_start, count) rows into hour-aligned bucket_mins buckets keyed by isoformat."""
+    counts = {}
+    for minute, n in minute_rows:
+        if isinstance(minute, str):
+            minute = datetime.fromisoformat(minute)
+        k = (minute - timedelta(minutes=minute.minute % bucket_mins)).isoformat()
+        counts[k] = counts.get(k, 0) + n
+    return counts
+
+def _count_filter(source, version):
+    """Extra WHERE clauses (and their params) for ingest_counts' source/version filters."""
+    clauses, params = "", []
+    if source is not None:
+        clauses += " AND source = ?"
+        params.append(source)
+    if version is not None:
+        clauses += " AND schema_version = ?"
+        params.append(version)
+    return clauses, params
+
+class SQLiteStorage(StorageBackend):
+    def __init__(self, path=None):
+        self.path = path or SQLITE_PATH
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS raw_data (
+                id INTEGER PRIMARY KEY,
+                schema_version INTEGER,
+                ingest_job_id TEXT,
+                ingest_ts TEXT,
+                source TEXT,
+                doc_hash TEXT,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS raw_data_ingest_ts ON raw_data(ingest_ts);
+            CREATE INDEX IF NOT EXISTS raw_data_schema_version_id ON raw_data(schema_version, id);
+            CREATE INDEX IF NOT EXISTS raw_data_ingest_job_id ON raw_data(ingest_job_id);
+            CREATE UNIQUE INDEX IF NOT EXISTS raw_data_doc_hash ON raw_data(doc_hash) WHERE doc_hash IS NOT NULL;
+        """)
+
+    def insert_many(self, docs, schema=None, meta=None):
+        rows, failed = _rows(docs, meta)
+        # ISO text sorts like the timestamps it encodes
+        rows = [(v, j, ts.isoformat() if isinstance(ts, datetime) else ts, src, h, b) for v, j, ts, src, h, b in rows]
+        with self._lock:
+            before = self.conn.total_changes
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO raw_data (schema_version, ingest_job_id, ingest_ts, source, doc_hash, body) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            inserted = self.conn.total_changes - before
+        self.last_skipped = len(rows) - inserted
+        return inserted, failed
+
+    def _where(self, flt):
+        clauses, params = [], []
+        for k, v in (flt or {}).items():
+            col = _COLUMNS.get(k)
+            if col:
+                clauses.append(f"{col} = ?")
+            else:
+                clauses.append("json_extract(body, ?) = ?")
+                params.append(f'$."{k}"')
+            params.append(v)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, version=None):
+        where, params = self._where({"_schema_version": version} if version is not None else None)
+        return self.conn.execute(f"SELECT count(*) FROM raw_data{where}", params).fetchone()[0]
+
+    def find(self, flt=None, limit=0):
+        where, params = self._where(flt)
+        sql = f"SELECT id, schema_version, ingest_job_id, ingest_ts, source, doc_hash, body FROM raw_data{where} ORDER BY id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [_doc(r) for r in self.conn.execute(sql, params)]
+
+    def get(self, doc_id, rehydrate=True):
+        # rows are keyed by the integer id column; nothing is externalized here
+        sql = "SELECT id, schema_version, ingest_job_id, ingest_ts, source, doc_hash, body FROM raw_data WHERE id = ?"
+        row = self.conn.execute(sql, (int(doc_id),)).fetchone()
+        return _doc(row) if row else None
+
+    def ingest_counts(self, since, bucket_mins=1, source=None, version=None):
+        where, params = _count_filter(source, version)
+        rows = self.conn.execute(
+            f"SELECT substr(ingest_ts, 1, 16), count(*) FROM raw_data WHERE ingest_ts >= ?{where} GROUP BY 1",
+            [since.isoformat()] + params,
+        )
+        return _bucket_counts(rows, bucket_mins)
+
+class DuckDBStorage(StorageBackend):
+    def __init__(self, path=None):
+        if duckdb is None:
+            raise RuntimeError("STORAGE_BACKEND=duckdb needs the duckdb package")
+        self.path = path or DUCKDB_PATH
+        self.conn = duckdb.connect(self.path)
+        self._lock = threading.Lock()
+        self.conn.execute("CREATE SEQUENCE IF NOT EXISTS raw_data_id")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_data (
+                id BIGINT DEFAULT nextval('raw_data_id'),
+                schema_version INTEGER,
+                ingest_job_id VARCHAR,
+                ingest_ts TIMESTAMP,
+                source VARCHAR,
+                doc_hash VARCHAR UNIQUE,
+                body VARCHAR NOT NULL
+            )
+        """)
+
+    def insert_many(self, docs, schema=None, meta=None):
+        rows, failed = _rows(docs, meta)
+        # OR IGNORE would also collapse rows whose doc_hash is NULL, so only hashed rows use it
+        hashed = [r for r in rows if r[4] is not None]
+        plain = [r for r in rows if r[4] is None] if hashed else rows
+        with self._lock:
+            inserted = self._insert(plain, "INSERT") + self._insert(hashed, "INSERT OR IGNORE")
+        self.last_skipped = len(rows) - inserted
+        return inserted, failed
+
+    def _insert(self, rows, verb):
+        if not rows:
+            return 0
+        cols = "schema_version, ingest_job_id, ingest_ts, source, doc_hash, body"
+        if pa is None:
+            before = self.count()
+            self.conn.executemany(f"{verb} INTO raw_data ({cols}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            return self.count() - before
+        # one columnar scan instead of a statement per row
+        version, job_id, ts, source, doc_hash, body = zip(*rows)
+        batch = pa.table({
+            "schema_version": pa.array(version, pa.int32()),
+            "ingest_job_id": pa.array(job_id, pa.string()),
+            "ingest_ts": pa.array(ts, pa.timestamp("us")),
+            "source": pa.array(source, pa.string()),
+            "doc_hash": pa.array(doc_hash, pa.string()),
+            "body": pa.array(body, pa.string()),
+        })
+        self.conn.register("raw_batch", batch)
+        try:
+            return self.conn.execute(f"{verb} INTO raw_data ({cols}) SELECT {cols} FROM raw_batch").fetchone()[0]
+        finally:
+            self.conn.unregister("raw_batch")
+
+    def _where(self, flt):
+        clauses, params = [], []
+        for k, v in (flt or {}).items():
+            col = _COLUMNS.get(k)
+            if col:
+                clauses.append(f"{col} = ?")
+                params.append(v)
+            else:
+                # compare as JSON text so numbers and strings both match
+                clauses.append("json_extract(body, ?) = ?::JSON")
+                params.extend([f'$."{k}"', orjson.dumps(v).decode()])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, version=None):
+        where, params = self._where({"_schema_version": version} if version is not None else None)
+        return self.conn.execute(f"SELECT count(*) FROM raw_data{where}", params).fetchone()[0]
+
+    def find(self, flt=None, limit=0):
+        where, params = self._where(flt)
+        sql = f"SELECT id, schema_version, ingest_job_id, ingest_ts, source, doc_hash, body FROM raw_data{where} ORDER BY id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [_doc(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def get(self, doc_id, rehydrate=True):
+        # rows are keyed by the integer id column; nothing is externalized here
+        sql = "SELECT id, schema_version, ingest_job_id, ingest_ts, source, doc_hash, body FROM raw_data WHERE id = ?"
+        row = self.conn.execute(sql, [int(doc_id)]).fetchone()
+        return _doc(row) if row else None
+
+    def ingest_counts(self, since, bucket_mins=1, source=None, version=None):
+        where, params = _count_filter(source, version)
+        rows = self.conn.execute(
+            f"SELECT date_trunc('minute', ingest_ts), count(*) FROM raw_data WHERE ingest_ts >= ?{where} GROUP BY 1",
+            [since] + params,
+        ).fetchall()
+        return _bucket_counts(rows, bucket_mins)
@@ -0,0 +1,52 @@
+# backend/app/events.py
+"""
+Schema events over Redis pub/sub.
+
+A new schema version and an /approve are published on SCHEMA_EVENTS_CHANNEL as
+{"version", "ts"}; the worker reactivating an older version on its own is not (that happens
+whenever sources alternate between known shapes). The announced version is also kept in
+<SCHEMA_EVENTS_CHANNEL>:active, so a subscriber that was down when the message went out can
+catch up at startup (pub/sub does not buffer messages).
+"""
+import os, orjson, redis
+from datetime import datetime
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SCHEMA_EVENTS_CHANNEL = os.getenv("SCHEMA_EVENTS_CHANNEL", "chrysalis:events:schema")
+
+r = redis.from_url(REDIS_URL, decode_responses=False)
+
+def _active_key():
+    return f"{SCHEMA_EVENTS_CHANNEL}:active"
+
+def publish_version_change(version):
+    """Best effort: a Redis outage must not fail the promotion itself."""
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.set(_active_key(), version)
+        pipe.publish(SCHEMA_EVENTS_CHANNEL, orjson.dumps({"version": version, "ts": datetime.utcnow().isoformat()}))
+        pipe.execute()
+    except Exception as e:
+        print("Schema event publish failed:", e)
+
+def active_version():
+    """Last version announced through publish_version_change, or None."""
+    v = r.get(_active_key())
+    return int(v) if v is not None else None
+
+def subscribe_version_changes(timeout=1.0):
+    """Yield the version of every schema change, and None every `timeout` seconds without one."""
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(SCHEMA_EVENTS_CHANNEL)
+    try:
+        while True:
+            msg = pubsub.get_message(timeout=timeout)
+            if msg is None:
+                yield None
+                continue
+            try:
+                yield orjson.loads(msg["data"])["version"]
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                continue
+    finally:
+        pubsub.close()
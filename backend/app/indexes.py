@@ -0,0 +1,124 @@
+# backend/app/indexes.py
+"""
+Index bootstrap for the collections the API, worker and Streamlit UI query.
+
+ensure_indexes() is idempotent and runs at API and worker startup. index_health() explains the
+hot queries and reports which of them fall back to a collection scan, plus per-index usage.
+"""
+from datetime import datetime
+from pymongo.errors import OperationFailure
+from .partitions import list_partitions
+from .mongo import mongo_db
+
+# collection -> [(keys, options)]
+INDEX_SPECS = {
+    "raw_data": [
+        # /metrics/ingest_rate time-range scans
+        ([("_ingest_ts", 1)], {"name": "_ingest_ts_1"}),
+        # Streamlit "filter by schema version", newest first
+        ([("_schema_version", 1), ("_id", -1)], {"name": "_schema_version_1__id_-1"}),
+        ([("_ingest_job_id", 1)], {"name": "_ingest_job_id_1"}),
+        # retention: a source's documents older than its cutoff, in _id order
+        ([("_source", 1), ("_ingest_ts", 1)], {"name": "_source_1__ingest_ts_1"}),
+        # DEDUPE_DOCS: duplicate content is rejected by the index
+        ([("_doc_hash", 1)], {
+            "name": "_doc_hash_1",
+            "unique": True,
+            "partialFilterExpression": {"_doc_hash": {"$type": "string"}},
+        }),
+    ],
+    "schema_registry": [
+        ([("version", 1)], {"name": "version_1", "unique": True}),
+        ([("schema_hash", 1)], {
+            "name": "schema_hash_1",
+            "unique": True,
+            "partialFilterExpression": {"schema_hash": {"$type": "string"}},
+        }),
+    ],
+}
+
+def _hot_queries():
+    """(collection, label, filter, sort) for the queries the app runs on every request/job."""
+    return [
+        ("raw_data", "ingest_rate", {"_ingest_ts": {"$gte": datetime.utcnow()}}, None),
+        ("raw_data", "ui_by_schema_version", {"_schema_version": 1}, [("_id", -1)]),
+        ("raw_data", "by_ingest_job", {"_ingest_job_id": "job"}, None),
+        ("schema_registry", "latest_version", {}, [("version", -1)]),
+        ("schema_registry", "by_schema_hash", {"schema_hash": "hash"}, None),
+    ]
+
+def ensure_collection_indexes(collection, spec_name):
+    """Create INDEX_SPECS[spec_name] on collection; returns the index names that exist."""
+    names = []
+    for keys, options in INDEX_SPECS[spec_name]:
+        try:
+            names.append(collection.create_index(keys, **options))
+        except OperationFailure as e:
+            # e.g. an index with the same name but other options, or duplicates blocking a unique index
+            print(f"[indexes] could not create {collection.name}.{options.get('name')}: {e}")
+    return names
+
+def ensure_indexes(database=None, collections=None):
+    """
+    Create the indexes in INDEX_SPECS if missing; raw_data partitions get the raw_data indexes.
+    collections limits it to some INDEX_SPECS entries (the schema registry bootstraps its own).
+    Returns {collection: [index names]}.
+    """
+    database = database if database is not None else mongo_db()
+    created = {}
+    for coll in INDEX_SPECS:
+        if collections is None or coll in collections:
+            created[coll] = ensure_collection_indexes(database[coll], coll)
+    if collections is not None and "raw_data" not in collections:
+        return created
+    for name in list_partitions(database):
+        if name not in created:
+            created[name] = ensure_collection_indexes(database[name], "raw_data")
+    return created
+
+def _stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for v in plan.values():
+            yield from _stages(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            yield from _stages(v)
+
+def index_health(database=None):
+    """
+    Explain each hot query and report its winning plan; queries with a COLLSCAN stage are listed
+    under "collection_scans". "indexes" holds $indexStats access counts per collection.
+    """
+    database = database if database is not None else mongo_db()
+    queries = []
+    for coll, label, flt, sort in _hot_queries():
+        cursor = database[coll].find(flt).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        except OperationFailure as e:
+            queries.append({"collection": coll, "query": label, "error": str(e)})
+            continue
+        stages = list(_stages(plan))
+        queries.append({
+            "collection": coll,
+            "query": label,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+        })
+    indexes = {}
+    for coll in INDEX_SPECS:
+        try:
+            stats = database[coll].aggregate([{"$indexStats": {}}])
+            indexes[coll] = [{"name": s["name"], "ops": s.get("accesses", {}).get("ops", 0)} for s in stats]
+        except OperationFailure as e:
+            indexes[coll] = {"error": str(e)}
+    return {
+        "queries": queries,
+        "collection_scans": [q["query"] for q in queries if q.get("collection_scan")],
+        "indexes": indexes,
+    }
@@ -0,0 +1,148 @@
+# backend/app/ingest_counters.py
+"""
+Ingest counters pre-aggregated at write time.
+
+Every insert HINCRBYs one Redis hash per minute (<INGEST_COUNTER_PREFIX>:m:<YYYYmmddHHMM>) with
+the fields total, source:<s>, version:<v> and source_version:<s>:<v>. Minute hashes expire
+after INGEST_COUNTER_MINUTE_TTL_SECS; before that, each finished hour is rolled up into an
+hourly hash (<INGEST_COUNTER_PREFIX>:h:<YYYYmmddHH>, kept INGEST_COUNTER_HOUR_TTL_SECS). An hour
+is rolled up only INGEST_COUNTER_ROLLUP_GRACE_SECS after it ends, so increments that arrive late
+for it (a slow job, DLQ revalidation) are in its minute hashes by then; ingest_counts reads the
+minute hashes for the whole minute TTL, so the hourly hashes are not needed any earlier. The last
+hour rolled up is kept in <INGEST_COUNTER_PREFIX>:rolled_through, so hours without any insert
+(or while every worker was down) are rolled up on the next insert too.
+
+ingest_counts() answers /metrics/ingest_rate by reading one hash per minute (or per hour for
+the part of the window older than the minute hashes) instead of scanning raw_data.
+"""
+import os, redis
+from datetime import datetime, timedelta
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+INGEST_COUNTER_PREFIX = os.getenv("INGEST_COUNTER_PREFIX", "chrysalis:ingest:counts")
+INGEST_COUNTER_MINUTE_TTL_SECS = int(os.getenv("INGEST_COUNTER_MINUTE_TTL_SECS", str(2 * 86400)))
+INGEST_COUNTER_HOUR_TTL_SECS = int(os.getenv("INGEST_COUNTER_HOUR_TTL_SECS", str(90 * 86400)))
+# must stay well below the minute TTL: the rollup needs the minute hashes still there
+INGEST_COUNTER_ROLLUP_GRACE_SECS = int(os.getenv("INGEST_COUNTER_ROLLUP_GRACE_SECS", "3600"))
+
+r = redis.from_url(REDIS_URL, decode_responses=False)
+
+# hour the rollup last ran through, cached per process
+_rolled_through = None
+
+def _rolled_key():
+    return f"{INGEST_COUNTER_PREFIX}:rolled_through"
+
+def _minute_key(ts):
+    return f"{INGEST_COUNTER_PREFIX}:m:{ts:%Y%m%d%H%M}"
+
+def _hour_key(ts):
+    return f"{INGEST_COUNTER_PREFIX}:h:{ts:%Y%m%d%H}"
+
+def _field(source=None, version=None):
+    if source is not None and version is not None:
+        return f"source_version:{source}:{version}"
+    if source is not None:
+        return f"source:{source}"
+    if version is not None:
+        return f"version:{version}"
+    return "total"
+
+def record_ingest(n, source=None, version=None, ts=None):
+    """Count n documents inserted at ts (default now) for source and schema version."""
+    if n <= 0:
+        return
+    ts = ts or datetime.utcnow()
+    key = _minute_key(ts)
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hincrby(key, "total", n)
+        if source is not None:
+            pipe.hincrby(key, _field(source=source), n)
+        if version is not None:
+            pipe.hincrby(key, _field(version=version), n)
+        if source is not None and version is not None:
+            pipe.hincrby(key, _field(source, version), n)
+        pipe.expire(key, INGEST_COUNTER_MINUTE_TTL_SECS)
+        pipe.execute()
+    except Exception as e:
+        # counters are for dashboards; never fail an insert over them
+        print("Ingest counter update failed:", e)
+        return
+    # the newest hour whose grace period is over
+    ready = datetime.utcnow() - timedelta(seconds=INGEST_COUNTER_ROLLUP_GRACE_SECS)
+    last_hour = ready.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+    if _rolled_through is None or last_hour > _rolled_through:
+        try:
+            rollup_through(last_hour)
+        except Exception as e:
+            print("Ingest counter rollup failed:", e)
+
+def rollup_through(last_hour):
+    """Roll up every hour after the persisted marker through last_hour (at most the retained minutes)."""
+    global _rolled_through
+    last_hour = last_hour.replace(minute=0, second=0, microsecond=0)
+    # hours older than the minute hashes have nothing left to sum
+    oldest = last_hour - timedelta(seconds=INGEST_COUNTER_MINUTE_TTL_SECS)
+    marker = r.get(_rolled_key())
+    hour = max(datetime.strptime(marker.decode(), "%Y%m%d%H") + timedelta(hours=1), oldest) if marker else last_hour
+    while hour <= last_hour:
+        rollup(hour)
+        hour += timedelta(hours=1)
+    # other workers may have gone further meanwhile; the marker only moves forward
+    if not marker or f"{last_hour:%Y%m%d%H}" > marker.decode():
+        r.set(_rolled_key(), f"{last_hour:%Y%m%d%H}")
+    _rolled_through = last_hour if _rolled_through is None else max(_rolled_through, last_hour)
+
+def rollup(hour):
+    """Sum the minute hashes of `hour` into its hourly hash, once across workers."""
+    global _rolled_through
+    hour = hour.replace(minute=0, second=0, microsecond=0)
+    hkey = _hour_key(hour)
+    if r.set(f"{hkey}:rolled", 1, nx=True, ex=INGEST_COUNTER_HOUR_TTL_SECS):
+        pipe = r.pipeline(transaction=False)
+        for m in range(60):
+            pipe.hgetall(_minute_key(hour + timedelta(minutes=m)))
+        totals = {}
+        for fields in pipe.execute():
+            for k, v in fields.items():
+                totals[k] = totals.get(k, 0) + int(v)
+        if totals:
+            pipe = r.pipeline(transaction=False)
+            pipe.hset(hkey, mapping=totals)
+            pipe.expire(hkey, INGEST_COUNTER_HOUR_TTL_SECS)
+            pipe.execute()
+    _rolled_through = hour if _rolled_through is None else max(_rolled_through, hour)
+
+def ingest_counts(since, bucket_mins=1, source=None, version=None, now=None):
+    """
+    {bucket_start_iso: docs ingested} since `since` in bucket_mins buckets aligned to the hour
+    (the shape RawDataRouter.ingest_counts returns). Hours reaching back past the minute hashes
+    (including the one the oldest retained minute falls in, whose first minutes are gone) come
+    from the hourly ones and land in the bucket their hour starts.
+    """
+    now = now or datetime.utcnow()
+    field = _field(source, version)
+    minute = since.replace(second=0, microsecond=0)
+    # the oldest minute hashes may already have expired; hours before that come from rollups
+    oldest_minute = (now - timedelta(seconds=INGEST_COUNTER_MINUTE_TTL_SECS)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    slots = []
+    if minute < oldest_minute:
+        hour = minute.replace(minute=0)
+        while hour < oldest_minute:
+            slots.append((hour, _hour_key(hour)))
+            hour += timedelta(hours=1)
+        minute = max(minute, hour)
+    while minute <= now:
+        slots.append((minute, _minute_key(minute)))
+        minute += timedelta(minutes=1)
+    pipe = r.pipeline(transaction=False)
+    for _, key in slots:
+        pipe.hget(key, field)
+    counts = {}
+    for (ts, _), n in zip(slots, pipe.execute()):
+        if n is None:
+            continue
+        k = (ts - timedelta(minutes=ts.minute % bucket_mins)).isoformat()
+        counts[k] = counts.get(k, 0) + int(n)
+    return counts
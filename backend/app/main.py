@@ -14,6 +14,8 @@ except Exception:
 
 # import metrics router
 from .metrics import router as metrics_router
+from .indexes import ensure_indexes
+from .storage import STORAGE_BACKEND
 
 # import approve router
 try:
@@ -23,6 +25,15 @@ except Exception:
 
 app = FastAPI(title="Chrysalis ETL API")
 
+@app.on_event("startup")
+def bootstrap_indexes():
+    if STORAGE_BACKEND != "mongo":
+        return
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print("Index bootstrap failed:", e)
+
 if ingest_router:
     app.include_router(ingest_router)
 if dlq_router:
@@ -2,28 +2,33 @@
 from fastapi import APIRouter, HTTPException
 from datetime import datetime, timedelta
 import os
-from pymongo import MongoClient
 import redis
+from dataclasses import asdict
+from .versioning import materialize_schema, get_schema_details
+from .schema_diff import SchemaDriftDetector
+from .indexes import index_health
+from .ingest_counters import ingest_counts
+from .storage import get_storage, mongo_db
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 DLQ_NAME = os.getenv("DLQ_NAME", "chrysalis:dlq")
+DLQ_STREAM = os.getenv("DLQ_STREAM", f"{DLQ_NAME}:stream")
 
-mongo = MongoClient(MONGO_URL)
-db = mongo["chrysalis"]
+_storage = None
 
-def parse_iso(s):
-    try:
-        return datetime.fromisoformat(s)
-    except Exception:
-        return None
+def raw_storage():
+    """The worker's raw document backend (STORAGE_BACKEND), created on first request."""
+    global _storage
+    if _storage is None:
+        _storage = get_storage()
+    return _storage
 
 @router.get("/raw_docs_count")
 def raw_docs_count():
     try:
-        c = db.raw_data.count_documents({})
+        c = raw_storage().count()
         return {"count": c}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -32,46 +37,76 @@ def raw_docs_count():
 def dlq_count():
     try:
         r = redis.from_url(REDIS_URL, decode_responses=False)
-        return {"dlq_length": r.llen(DLQ_NAME)}
+        return {"dlq_length": r.xlen(DLQ_STREAM)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/index_health")
+def index_health_report():
+    try:
+        return index_health(mongo_db())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/schema_changes")
-def schema_changes(limit: int = 50):
+def schema_changes(limit: int = 50, include_schema: bool = False):
     try:
-        docs = list(db.schema_registry.find().sort("version", -1).limit(limit))
+        # samples/stats live in schema_registry_details; only the compact diff is needed here
+        projection = {"version": 1, "created_at": 1, "diff.added": 1, "diff.removed": 1, "diff.changed": 1}
+        docs = list(mongo_db().schema_registry.find({}, projection).sort("version", -1).limit(limit))
         out = []
         for d in docs:
-            out.append({
+            item = {
                 "version": d.get("version"),
                 "created_at": d.get("created_at", None),
                 "diff": d.get("diff", None),
-            })
+            }
+            if include_schema:
+                # entries may be stored as deltas; materialize_schema replays (and caches) them
+                item["schema"] = materialize_schema(d.get("version"))
+            out.append(item)
         return {"schemas": out}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/schema_diff")
+def schema_diff(from_version: int, to_version: int):
+    old = materialize_schema(from_version)
+    new = materialize_schema(to_version)
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Unknown schema version")
+    try:
+        details = get_schema_details(to_version) or {}
+        diff = SchemaDriftDetector.compute_diff(old, new, details.get("field_stats") or {})
+        return {"from_version": from_version, "to_version": to_version, "diff": asdict(diff)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/raw_doc/{doc_id}")
+def raw_doc(doc_id: str, rehydrate: bool = True):
+    """One raw document (across partitions on Mongo); externalized fields are loaded unless rehydrate=false."""
+    try:
+        doc = raw_storage().get(doc_id, rehydrate=rehydrate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document id")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    doc["_id"] = str(doc["_id"])
+    return doc
+
 @router.get("/ingest_rate")
-def ingest_rate(minutes: int = 60, bucket_mins: int = 1):
+def ingest_rate(minutes: int = 60, bucket_mins: int = 1, source: str = None, version: int = None, scan: bool = False):
     try:
         now = datetime.utcnow()
         start = now - timedelta(minutes=minutes)
-        cutoff = start.isoformat()
-        cursor = db.raw_data.find({"_ingest_ts": {"$gte": cutoff}}, {"_ingest_ts": 1})
-        counts = {}
-        for doc in cursor:
-            ts = doc.get("_ingest_ts")
-            if not ts:
-                continue
-            try:
-                dt = datetime.fromisoformat(ts)
-            except Exception:
-                dt = parse_iso(ts)
-                if dt is None:
-                    continue
-            bucket_minute = dt.replace(second=0, microsecond=0) - timedelta(minutes=(dt.minute % bucket_mins))
-            key = bucket_minute.isoformat()
-            counts[key] = counts.get(key, 0) + 1
+        if scan:
+            # recount from raw_data itself (data written before the counters existed)
+            counts = raw_storage().ingest_counts(start, bucket_mins, source=source, version=version)
+        else:
+            # one pre-aggregated counter hash per minute (per hour for older data)
+            counts = ingest_counts(start, bucket_mins, source=source, version=version, now=now)
         timeline = []
         cur = start.replace(second=0, microsecond=0)
         if cur.minute % bucket_mins != 0:
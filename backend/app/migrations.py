@@ -0,0 +1,67 @@
+# backend/app/migrations.py
+"""
+Background data migrations.
+
+migrate_ingest_ts() rewrites raw_data documents whose _ingest_ts is still an ISO string (written
+before the worker stored BSON dates) into native dates, in small _id-ordered batches with a pause
+between them so it can run next to live ingestion. Strings that do not parse are left as they are.
+"""
+import os, time, threading
+from datetime import datetime
+from pymongo import UpdateOne
+from .mongo import mongo_db
+
+MIGRATE_INGEST_TS = os.getenv("MIGRATE_INGEST_TS", "1") == "1"
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "500"))
+MIGRATE_PAUSE_SECS = float(os.getenv("MIGRATE_PAUSE_SECS", "0.2"))
+
+def _parse_iso(s):
+    try:
+        return datetime.fromisoformat(s)
+    except (TypeError, ValueError):
+        return None
+
+def migrate_ingest_ts(collection=None, batch_size=None, pause=None):
+    """Convert string _ingest_ts values to dates. Returns (converted, skipped)."""
+    collection = collection if collection is not None else mongo_db()["raw_data"]
+    batch_size = batch_size or MIGRATE_BATCH_SIZE
+    pause = MIGRATE_PAUSE_SECS if pause is None else pause
+    converted = skipped = 0
+    last_id = None
+    while True:
+        flt = {"_ingest_ts": {"$type": "string"}}
+        if last_id is not None:
+            flt["_id"] = {"$gt": last_id}
+        batch = list(collection.find(flt, {"_ingest_ts": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        ops = []
+        for d in batch:
+            ts = _parse_iso(d["_ingest_ts"])
+            if ts is None:
+                skipped += 1
+                continue
+            # only if nobody rewrote it meanwhile
+            ops.append(UpdateOne({"_id": d["_id"], "_ingest_ts": d["_ingest_ts"]}, {"$set": {"_ingest_ts": ts}}))
+        if ops:
+            converted += collection.bulk_write(ops, ordered=False).modified_count
+        if pause:
+            time.sleep(pause)
+    return converted, skipped
+
+def _run_ingest_ts_migration():
+    try:
+        converted, skipped = migrate_ingest_ts()
+        if converted or skipped:
+            print(f"[migrations] _ingest_ts: converted {converted}, left {skipped} unparseable")
+    except Exception as e:
+        print("[migrations] _ingest_ts migration failed:", e)
+
+def start_ingest_ts_migration():
+    """Run migrate_ingest_ts in a daemon thread unless MIGRATE_INGEST_TS=0."""
+    if not MIGRATE_INGEST_TS:
+        return None
+    t = threading.Thread(target=_run_ingest_ts_migration, name="migrate-ingest-ts", daemon=True)
+    t.start()
+    return t
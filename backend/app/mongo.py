@@ -0,0 +1,22 @@
+# backend/app/mongo.py
+"""
+The process-wide MongoClient, created on first use. Modules that only sometimes need Mongo
+(raw data with STORAGE_BACKEND=sqlite|duckdb, the disk DLQ spill tier, local blobs) call
+mongo_db() when they do instead of connecting at import.
+"""
+import os, threading
+from pymongo import MongoClient
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+
+_client = None
+_client_lock = threading.Lock()
+
+def mongo_db():
+    """The chrysalis database, connected on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URL)
+    return _client["chrysalis"]
@@ -0,0 +1,249 @@
+# backend/app/parquet_sink.py
+"""
+Columnar copy of accepted documents for analytics.
+
+ParquetSink appends every batch StorageManager wrote to Mongo to rolling Parquet files, one
+directory per schema version (PARQUET_SINK_DIR/v<N>/part-*.parquet). Columns come from the
+version's JSON schema (integer -> int64, number -> float64, string, boolean; objects/arrays as
+JSON text) plus the _schema_version/_ingest_job_id/_ingest_ts/_source/_id metadata. Values that do not fit
+their column, and fields the schema does not declare, go to the _extra column as JSON so nothing
+is lost.
+
+Rows are buffered until PARQUET_ROW_GROUP_SIZE and a file is rotated after PARQUET_MAX_FILE_ROWS
+or, when the worker is idle, PARQUET_FLUSH_SECS after the last flush.
+A file is written as *.parquet.tmp and renamed when closed; only closed files are listed in
+manifest.json (rows, row groups, columns, _ingest_ts range), which scan_column() reads from.
+Workers sharing PARQUET_SINK_DIR update the manifest under a flock on manifest.json.lock; within
+a process, write and flush take a lock (the worker loop and DLQ revalidation share one sink).
+
+pyarrow is optional; without it the sink is disabled.
+"""
+import os, json, time, fcntl, threading
+from datetime import datetime
+
+import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+PARQUET_SINK_DIR = os.getenv("PARQUET_SINK_DIR", "")
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "50000"))
+PARQUET_MAX_FILE_ROWS = int(os.getenv("PARQUET_MAX_FILE_ROWS", "1000000"))
+PARQUET_FLUSH_SECS = float(os.getenv("PARQUET_FLUSH_SECS", "60"))
+
+MANIFEST = "manifest.json"
+_META = ("_schema_version", "_ingest_job_id", "_ingest_ts", "_source", "_id")
+_MISS = object()
+
+def _json_text(v):
+    return orjson.dumps(v, default=str).decode()
+
+def _column_types(schema):
+    """[(field, arrow type, coerce)] for the schema's properties; coerce returns _MISS if v does not fit."""
+    cols = []
+    for k, spec in ((schema or {}).get("properties") or {}).items():
+        if k in _META or k == "_extra":
+            continue
+        t = spec.get("type") if isinstance(spec, dict) else None
+        if t == "integer":
+            cols.append((k, pa.int64(), lambda v: v if type(v) is int else _MISS))
+        elif t == "number":
+            cols.append((k, pa.float64(), lambda v: float(v) if type(v) in (int, float) else _MISS))
+        elif t == "string":
+            cols.append((k, pa.string(), lambda v: v if type(v) is str else _MISS))
+        elif t == "boolean":
+            cols.append((k, pa.bool_(), lambda v: v if type(v) is bool else _MISS))
+        else:
+            cols.append((k, pa.string(), _json_text))
+    return cols
+
+def _ts(doc, meta):
+    ts = (meta or doc).get("_ingest_ts")
+    return ts if isinstance(ts, datetime) else None
+
+def _id_text(doc, oid):
+    oid = oid if oid is not None else doc.get("_id")
+    return str(oid) if oid is not None else None
+
+class _VersionWriter:
+    def __init__(self, sink, version, schema):
+        self.sink = sink
+        self.version = version
+        self.columns = _column_types(schema)
+        self.arrow_schema = pa.schema(
+            [("_schema_version", pa.int64()), ("_ingest_job_id", pa.string()),
+             ("_ingest_ts", pa.timestamp("us")), ("_source", pa.string()), ("_id", pa.string())]
+            + [(k, t) for k, t, _ in self.columns]
+            + [("_extra", pa.string())]
+        )
+        self.buffer = []
+        self.writer = None
+        self.path = None
+        self.file_rows = 0
+        self.row_groups = 0
+        self.ts_range = [None, None]
+
+    def append(self, docs):
+        self.buffer.extend(docs)
+        while len(self.buffer) >= self.sink.row_group_size:
+            self._write(self.buffer[:self.sink.row_group_size])
+            self.buffer = self.buffer[self.sink.row_group_size:]
+
+    def flush(self):
+        if self.buffer:
+            self._write(self.buffer)
+            self.buffer = []
+
+    def _table(self, docs):
+        # buffered rows are (doc, meta, _id); meta/_id are None when they are on the doc itself
+        rows = docs
+        docs = [d for d, _, _ in rows]
+        names = {k for k, _, _ in self.columns}
+        data = {
+            "_schema_version": [self.version] * len(docs),
+            "_ingest_job_id": [(m or d).get("_ingest_job_id") for d, m, _ in rows],
+            "_ingest_ts": [_ts(d, m) for d, m, _ in rows],
+            "_source": [(m or d).get("_source") for d, m, _ in rows],
+            "_id": [_id_text(d, oid) for d, _, oid in rows],
+        }
+        extras = [{} for _ in docs]
+        for k, _, coerce in self.columns:
+            col = []
+            for d, extra in zip(docs, extras):
+                v = d.get(k)
+                if v is None:
+                    col.append(None)
+                    continue
+                c = coerce(v)
+                if c is _MISS:
+                    extra[k] = v
+                    c = None
+                col.append(c)
+            data[k] = col
+        for d, extra in zip(docs, extras):
+            for k, v in d.items():
+                if k not in names and k not in _META:
+                    extra[k] = v
+        data["_extra"] = [_json_text(e) if e else None for e in extras]
+        return pa.Table.from_pydict(data, schema=self.arrow_schema)
+
+    def _write(self, docs):
+        if self.writer is None:
+            d = os.path.join(self.sink.root, f"v{self.version}")
+            os.makedirs(d, exist_ok=True)
+            self.path = os.path.join(d, f"part-{time.time_ns()}.parquet")
+            self.writer = pq.ParquetWriter(self.path + ".tmp", self.arrow_schema)
+        self.writer.write_table(self._table(docs), row_group_size=self.sink.row_group_size)
+        self.row_groups += 1
+        self.file_rows += len(docs)
+        for d, m, _ in docs:
+            ts = _ts(d, m)
+            if ts is not None:
+                lo, hi = self.ts_range
+                self.ts_range = [ts if lo is None or ts < lo else lo, ts if hi is None or ts > hi else hi]
+        if self.file_rows >= self.sink.max_file_rows:
+            self.close()
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.path + ".tmp", self.path)
+        self.sink._record({
+            "path": os.path.relpath(self.path, self.sink.root),
+            "version": self.version,
+            "rows": self.file_rows,
+            "row_groups": self.row_groups,
+            "columns": self.arrow_schema.names,
+            "min_ingest_ts": self.ts_range[0].isoformat() if self.ts_range[0] else None,
+            "max_ingest_ts": self.ts_range[1].isoformat() if self.ts_range[1] else None,
+        })
+        self.writer = None
+        self.file_rows = self.row_groups = 0
+        self.ts_range = [None, None]
+
+class ParquetSink:
+    def __init__(self, root=None, row_group_size=None, max_file_rows=None):
+        self.root = root or PARQUET_SINK_DIR
+        self.row_group_size = row_group_size or PARQUET_ROW_GROUP_SIZE
+        self.max_file_rows = max_file_rows or PARQUET_MAX_FILE_ROWS
+        self._writers = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def write(self, docs, schema=None, meta=None, ids=None):
+        """
+        Append docs (already in Mongo) grouped by _schema_version. meta is the per-job metadata
+        when it is not set on the docs (RawBSON inserts), ids the _id generated per id(doc).
+        """
+        groups = {}
+        for d in docs:
+            version = (meta or d).get("_schema_version")
+            groups.setdefault(version, []).append((d, meta, ids.get(id(d)) if ids else None))
+        with self._lock:
+            for version, group in groups.items():
+                w = self._writers.get(version)
+                if w is None:
+                    w = self._writers[version] = _VersionWriter(self, version, schema)
+                w.append(group)
+
+    def flush(self):
+        """Write buffered rows and close the open files so they show up in the manifest."""
+        with self._lock:
+            for w in self._writers.values():
+                w.flush()
+                w.close()
+            self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """flush() if PARQUET_FLUSH_SECS passed since the last one; called while the worker is idle."""
+        if time.monotonic() - self._last_flush >= PARQUET_FLUSH_SECS:
+            self.flush()
+
+    def _record(self, entry):
+        # read-modify-write: without the lock, concurrent workers drop each other's entries
+        with open(os.path.join(self.root, MANIFEST + ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                manifest = read_manifest(self.root)
+                manifest["files"].append(entry)
+                tmp = os.path.join(self.root, f"{MANIFEST}.{os.getpid()}.tmp")
+                with open(tmp, "w") as f:
+                    json.dump(manifest, f, indent=1)
+                os.replace(tmp, os.path.join(self.root, MANIFEST))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def get_sink():
+    """The configured sink, or None when PARQUET_SINK_DIR is unset or pyarrow is missing."""
+    if not PARQUET_SINK_DIR:
+        return None
+    if pa is None:
+        print("[parquet] PARQUET_SINK_DIR is set but pyarrow is not installed; sink disabled")
+        return None
+    return ParquetSink()
+
+def read_manifest(root=None):
+    path = os.path.join(root or PARQUET_SINK_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {"files": []}
+    with open(path) as f:
+        return json.load(f)
+
+def scan_column(field, versions=None, root=None):
+    """Read one column across the manifest's files (optionally only some versions) as a pyarrow ChunkedArray."""
+    root = root or PARQUET_SINK_DIR
+    paths = [
+        os.path.join(root, e["path"]) for e in read_manifest(root)["files"]
+        if field in e["columns"] and (versions is None or e["version"] in versions)
+    ]
+    if not paths:
+        return pa.chunked_array([], type=pa.null())
+    columns = [pq.read_table(p, columns=[field]).column(field) for p in paths]
+    if len({c.type for c in columns}) > 1:
+        raise ValueError(f"{field} has different types across versions; pass versions=")
+    return pa.chunked_array([chunk for c in columns for chunk in c.chunks], type=columns[0].type)
@@ -0,0 +1,162 @@
+# backend/app/partitions.py
+"""
+Partitioned raw_data collections.
+
+With RAW_PARTITION_MODE=version|day|month, accepted documents are written to raw_data_v{version},
+raw_data_{YYYYMMDD} or raw_data_{YYYYMM} instead of the single raw_data collection ("none", the
+default, keeps raw_data). Retention then drops whole partitions instead of running delete_many.
+
+RawDataRouter is the read side: it lists the partitions that exist (plus the unpartitioned
+raw_data, which keeps data written before partitioning was enabled), prunes them by version or
+time range, and fans queries out across what is left.
+"""
+import os, re
+from datetime import datetime, timedelta
+from .blobstore import rehydrate as rehydrate_doc
+from .mongo import mongo_db
+
+RAW_PARTITION_MODE = os.getenv("RAW_PARTITION_MODE", "none")
+RAW_PREFIX = "raw_data"
+
+_PARTITION_RE = re.compile(r"^raw_data(?:_(?:v(\d+)|(\d{8})|(\d{6})))?$")
+# server-side filter for list_collection_names
+PARTITION_NAME_REGEX = r"^raw_data(_(v\d+|\d{8}|\d{6}))?$"
+
+def partition_name(version=None, ts=None, mode=None):
+    """Collection a document with this _schema_version/_ingest_ts is written to."""
+    mode = mode or RAW_PARTITION_MODE
+    if mode == "version" and version is not None:
+        return f"{RAW_PREFIX}_v{version}"
+    if mode in ("day", "month"):
+        ts = ts if isinstance(ts, datetime) else datetime.utcnow()
+        return f"{RAW_PREFIX}_{ts.strftime('%Y%m%d' if mode == 'day' else '%Y%m')}"
+    return RAW_PREFIX
+
+def parse_partition(name):
+    """
+    ("version", n, None, None), ("day"|"month", None, start, end) or ("base", None, None, None)
+    for a raw_data collection name; None if name is not one.
+    """
+    m = _PARTITION_RE.match(name)
+    if not m:
+        return None
+    version, day, month = m.groups()
+    if version:
+        return ("version", int(version), None, None)
+    if day:
+        start = datetime.strptime(day, "%Y%m%d")
+        return ("day", None, start, start + timedelta(days=1))
+    if month:
+        start = datetime.strptime(month, "%Y%m")
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return ("month", None, start, end)
+    return ("base", None, None, None)
+
+def list_partitions(database=None):
+    database = database if database is not None else mongo_db()
+    return sorted(database.list_collection_names(filter={"name": {"$regex": PARTITION_NAME_REGEX}}))
+
+def _sort_docs(docs, sort):
+    # stable sort, least significant key first
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: (d.get(field) is not None, d.get(field)), reverse=direction < 0)
+    return docs
+
+class RawDataRouter:
+    def __init__(self, database=None, names=None):
+        # names pins the router to fixed collections instead of discovering partitions
+        self.db = database if database is not None else mongo_db()
+        self.names = names
+
+    def collections(self, since=None, until=None, versions=None):
+        """
+        Partitions that can hold matching documents. versions prunes version partitions, since/until
+        (_ingest_ts bounds) prune time partitions; the base collection is always included.
+        """
+        if self.names is not None:
+            return [self.db[n] for n in self.names]
+        versions = set(versions) if versions is not None else None
+        out = []
+        for name in list_partitions(self.db):
+            kind, version, start, end = parse_partition(name)
+            if kind == "version" and versions is not None and version not in versions:
+                continue
+            if start is not None:
+                if since is not None and end <= since:
+                    continue
+                if until is not None and start > until:
+                    continue
+            out.append(self.db[name])
+        return out
+
+    def count_documents(self, flt=None, **prune):
+        return sum(c.count_documents(flt or {}) for c in self.collections(**prune))
+
+    def find(self, flt=None, projection=None, sort=None, limit=0, rehydrate=False, **prune):
+        """find() across partitions; with sort+limit each partition returns its top `limit` and
+        the results are merged. rehydrate=True (or a list of fields) loads externalized content."""
+        docs = []
+        for c in self.collections(**prune):
+            cursor = c.find(flt or {}, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            docs.extend(cursor)
+        if sort:
+            _sort_docs(docs, sort)
+        docs = docs[:limit] if limit else docs
+        if rehydrate:
+            fields = None if rehydrate is True else rehydrate
+            for d in docs:
+                rehydrate_doc(d, fields)
+        return docs
+
+    def aggregate(self, pipeline, **prune):
+        """Run pipeline on every partition and yield the rows; merging is up to the caller."""
+        for c in self.collections(**prune):
+            yield from c.aggregate(pipeline)
+
+    def ingest_counts(self, since, bucket_mins=1, source=None, version=None):
+        """
+        {bucket_start_iso: docs ingested} since `since`, in bucket_mins buckets aligned to the hour,
+        optionally only of one source and/or schema version.
+        _ingest_ts is a BSON date: the range match uses the _ingest_ts index and the bucketing
+        runs inside Mongo, so only one row per bucket and partition comes back.
+        """
+        match = {"_ingest_ts": {"$gte": since}}
+        if source is not None:
+            match["_source"] = source
+        if version is not None:
+            match["_schema_version"] = version
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"$dateSubtract": {
+                    "startDate": {"$dateTrunc": {"date": "$_ingest_ts", "unit": "minute"}},
+                    "unit": "minute",
+                    "amount": {"$mod": [{"$minute": "$_ingest_ts"}, bucket_mins]},
+                }},
+                "count": {"$sum": 1},
+            }},
+        ]
+        counts = {}
+        # time partitions older than the window are skipped; buckets are summed across partitions
+        for row in self.aggregate(pipeline, since=since, versions=[version] if version is not None else None):
+            k = row["_id"].isoformat()
+            counts[k] = counts.get(k, 0) + row["count"]
+        return counts
+
+    def drop_partitions(self, before=None, versions=None):
+        """
+        Drop whole partitions: time partitions ending at or before `before`, version partitions in
+        `versions`. The base raw_data collection is never dropped. Returns the dropped names.
+        """
+        versions = set(versions or [])
+        dropped = []
+        for name in list_partitions(self.db):
+            kind, version, start, end = parse_partition(name)
+            if (kind == "version" and version in versions) or (end is not None and before is not None and end <= before):
+                self.db.drop_collection(name)
+                dropped.append(name)
+        return dropped
@@ -0,0 +1,214 @@
+# backend/app/retention.py
+"""
+Retention for raw_data (and its partitions), per source (_source, the job's "source").
+
+RETENTION_POLICIES is JSON mapping a source to {"days": N, "action": ...}; "*" is the policy for
+every source without its own entry (including documents written before _source existed):
+
+  {"*": {"days": 90, "action": "archive"}, "sensor-feed": {"days": 7, "action": "ttl"}}
+
+Actions:
+  archive  stream expired documents in _id order into gzip NDJSON files (bson.json_util, canonical
+           mode, so types round-trip) under ARCHIVE_DIR, then delete exactly what was written
+  delete   bulk delete without archiving
+  ttl      let Mongo expire them: a partial TTL index on _ingest_ts for the source, or, for "*",
+           expireAfterSeconds on the existing _ingest_ts_1 index (only when no other source
+           would lose data to it: every other policy must be ttl with fewer days)
+
+Time partitions that end before a cutoff and end up empty are dropped whole.
+TTL indexes are (re)applied on every run, so partitions created since the last run pick them up.
+restore_archive() streams an archive file back in; re-running it is harmless.
+"""
+import os, gzip, json, re, time, threading
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, OperationFailure
+from bson import json_util
+from bson.json_util import JSONOptions, JSONMode
+from .partitions import RawDataRouter, parse_partition
+from .mongo import mongo_db
+
+RETENTION_POLICIES = os.getenv("RETENTION_POLICIES", "")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_FILE_DOCS = int(os.getenv("ARCHIVE_FILE_DOCS", "50000"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "1000"))
+RETENTION_INTERVAL_SECS = int(os.getenv("RETENTION_INTERVAL_SECS", "3600"))
+
+_JSON_OPTIONS = JSONOptions(json_mode=JSONMode.CANONICAL)
+
+def load_policies(raw=None):
+    """{source: {"days": int, "action": str}} from RETENTION_POLICIES."""
+    raw = RETENTION_POLICIES if raw is None else raw
+    if not raw:
+        return {}
+    policies = {}
+    for source, p in json.loads(raw).items():
+        action = p.get("action", "archive")
+        if action not in ("archive", "delete", "ttl"):
+            raise ValueError(f"retention policy for {source!r}: unknown action {action!r}")
+        policies[source] = {"days": int(p["days"]), "action": action}
+    return policies
+
+def _source_filter(source, policies):
+    if source != "*":
+        return {"_source": source}
+    # the default covers every source without a policy of its own, and docs without _source
+    return {"_source": {"$nin": [s for s in policies if s != "*"]}}
+
+def _archive_path(coll_name, source, cutoff, first_id):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", "default" if source == "*" else source)
+    d = os.path.join(ARCHIVE_DIR, coll_name, safe)
+    os.makedirs(d, exist_ok=True)
+    return os.path.join(d, f"{cutoff:%Y%m%d}-{first_id}.ndjson.gz")
+
+def archive_expired(coll, flt, source, cutoff, delete_only=False):
+    """
+    Archive (unless delete_only) and delete the documents of coll matching flt, in _id order.
+    Each file is closed before the _ids it holds are deleted; delete_only reads the _ids alone.
+    Returns (archived, deleted).
+    """
+    archived = deleted = 0
+    last_id = None
+    projection = {"_id": 1} if delete_only else None
+    while True:
+        q = dict(flt)
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        cursor = coll.find(q, projection).sort("_id", 1).limit(ARCHIVE_FILE_DOCS).batch_size(RETENTION_BATCH)
+        ids, out, path = [], None, None
+        try:
+            for doc in cursor:
+                if not delete_only:
+                    if out is None:
+                        path = _archive_path(coll.name, source, cutoff, doc["_id"])
+                        out = gzip.open(path + ".tmp", "wt", encoding="utf-8")
+                    out.write(json_util.dumps(doc, json_options=_JSON_OPTIONS))
+                    out.write("\n")
+                ids.append(doc["_id"])
+        finally:
+            if out is not None:
+                out.close()
+        if not ids:
+            break
+        if path:
+            os.replace(path + ".tmp", path)
+            archived += len(ids)
+        for i in range(0, len(ids), RETENTION_BATCH):
+            deleted += coll.delete_many({"_id": {"$in": ids[i:i + RETENTION_BATCH]}}).deleted_count
+        last_id = ids[-1]
+        if len(ids) < ARCHIVE_FILE_DOCS:
+            break
+    return archived, deleted
+
+def _ttl_index_name(source):
+    return "ttl__ingest_ts__" + re.sub(r"[^A-Za-z0-9_]", "_", source)
+
+def ensure_ttl(coll, source, days, policies):
+    """Expire a source's documents after `days` through a TTL index; an existing one is updated."""
+    seconds = days * 86400
+    if source == "*":
+        # a collection-wide TTL expires every source: those archived or deleted by their own
+        # policy, or kept at least as long, would lose documents to it
+        blocked = [s for s, p in policies.items() if s != "*" and (p["action"] != "ttl" or p["days"] >= days)]
+        if blocked:
+            print(f"[retention] not using TTL for '*': {', '.join(blocked)} have their own retention; use archive/delete")
+            return False
+        coll.database.command("collMod", coll.name, index={"name": "_ingest_ts_1", "expireAfterSeconds": seconds})
+        return True
+    name = _ttl_index_name(source)
+    existing = coll.index_information().get(name)
+    if existing is not None:
+        # create_index would fail with IndexOptionsConflict once the policy's days change
+        if existing.get("expireAfterSeconds") != seconds:
+            coll.database.command("collMod", coll.name, index={"name": name, "expireAfterSeconds": seconds})
+        return True
+    coll.create_index(
+        [("_ingest_ts", 1)],
+        name=name,
+        expireAfterSeconds=seconds,
+        partialFilterExpression={"_source": source},
+    )
+    return True
+
+def apply_retention(policies=None, now=None, database=None):
+    """Apply every policy to raw_data and its partitions; returns per (collection, source) counts."""
+    policies = load_policies() if policies is None else policies
+    now = now or datetime.utcnow()
+    router = RawDataRouter(database if database is not None else mongo_db())
+    report = []
+    for source, policy in policies.items():
+        cutoff = now - timedelta(days=policy["days"])
+        flt = {**_source_filter(source, policies), "_ingest_ts": {"$lt": cutoff}}
+        # time partitions starting after the cutoff hold nothing old enough (TTL goes on every one)
+        for coll in router.collections(until=None if policy["action"] == "ttl" else cutoff):
+            entry = {"collection": coll.name, "source": source, "action": policy["action"]}
+            try:
+                if policy["action"] == "ttl":
+                    entry["ttl"] = ensure_ttl(coll, source, policy["days"], policies)
+                else:
+                    entry["archived"], entry["deleted"] = archive_expired(
+                        coll, flt, source, cutoff, delete_only=policy["action"] == "delete"
+                    )
+            except OperationFailure as e:
+                entry["error"] = str(e)
+            report.append(entry)
+    if not policies:
+        return report
+    # time partitions that ended before the most recent cutoff and are empty now are dropped whole
+    latest_cutoff = now - timedelta(days=min(p["days"] for p in policies.values()))
+    for coll in router.collections(until=latest_cutoff):
+        end = parse_partition(coll.name)[3]
+        if end is not None and end <= latest_cutoff and coll.estimated_document_count() == 0:
+            coll.drop()
+            report.append({"collection": coll.name, "dropped": True})
+    return report
+
+RESTORE_COLLECTION = "raw_data_restored"
+
+def restore_archive(path, collection=None, database=None):
+    """
+    Stream an archive file into `collection`. The default, raw_data_restored, is outside the
+    partition scheme, so retention does not archive the documents again on its next run.
+    Returns docs inserted.
+    """
+    database = database if database is not None else mongo_db()
+    coll = database[collection or RESTORE_COLLECTION]
+    inserted = 0
+    batch = []
+
+    def _flush():
+        nonlocal inserted
+        try:
+            inserted += len(coll.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # documents already back (an earlier restore) keep their _id and are skipped
+            inserted += e.details.get("nInserted", 0)
+        batch.clear()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json_util.loads(line, json_options=_JSON_OPTIONS))
+            if len(batch) >= RETENTION_BATCH:
+                _flush()
+    if batch:
+        _flush()
+    return inserted
+
+def _retention_loop():
+    while True:
+        try:
+            for entry in apply_retention():
+                if entry.get("archived") or entry.get("deleted") or entry.get("dropped") or entry.get("error"):
+                    print("[retention]", entry)
+        except Exception as e:
+            print("[retention] run failed:", e)
+        time.sleep(RETENTION_INTERVAL_SECS)
+
+def start_retention():
+    """Run apply_retention every RETENTION_INTERVAL_SECS in a daemon thread when policies are set."""
+    if not RETENTION_POLICIES:
+        return None
+    load_policies()  # fail fast on a malformed RETENTION_POLICIES
+    t = threading.Thread(target=_retention_loop, name="retention", daemon=True)
+    t.start()
+    return t
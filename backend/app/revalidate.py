@@ -0,0 +1,163 @@
+# backend/app/revalidate.py
+"""
+Background revalidation of the DLQ after a schema change.
+
+Whenever a schema version is announced (events.publish_version_change: a new version or an
+/approve), validation_failed entries dead-lettered before the announcement are scanned REVALIDATE_BATCH entries at a time and their
+documents re-checked with the batch validator against the new version. Documents that pass
+now go straight into raw_data through the storage backend (bulk insert_many, tagged with the
+new version and their original job), not through the ingest queue. Documents that still fail
+are dead-lettered again under the new version (as are stored failures that are not documents
+at all), and processed entries are removed.
+
+One revalidation runs at a time across workers (a Redis lock), and the last revalidated
+version is recorded, so a worker starting after a change it missed catches up.
+"""
+import os, time, threading, redis
+from datetime import datetime
+from .dlq import list_entries, entries_failures, remove_entries, send_failures, last_entry_ms, DLQ_NAME
+from .events import subscribe_version_changes, active_version
+from .versioning import get_latest_schema_meta, materialize_schema
+from .validator import validate_batch
+from .storage import get_storage
+from .dedupe import stamped, unstamped, DEDUPE_DOCS
+from .ingest_counters import record_ingest
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REVALIDATE_DLQ = os.getenv("REVALIDATE_DLQ", "1") == "1"
+REVALIDATE_BATCH = int(os.getenv("REVALIDATE_BATCH", "100"))
+REVALIDATE_LOCK_SECS = int(os.getenv("REVALIDATE_LOCK_SECS", "300"))
+REVALIDATE_CHECK_SECS = float(os.getenv("REVALIDATE_CHECK_SECS", "30"))
+
+r = redis.from_url(REDIS_URL, decode_responses=False)
+
+_DONE_KEY = f"{DLQ_NAME}:revalidated_version"
+_LOCK_KEY = f"{DLQ_NAME}:revalidate_lock"
+# used when revalidate_dlq gets no storage: one backend per process, not one per run
+_storage = None
+
+def _default_storage():
+    global _storage
+    if _storage is None:
+        _storage = get_storage()
+    return _storage
+
+def _revalidate_page(items, version, schema, storage, stats):
+    inserts, still = {}, {}
+    for item, fails in zip(items, entries_failures(items)):
+        payload = item["payload"] if isinstance(item["payload"], dict) else {}
+        key = (payload.get("job_id", "unknown"), payload.get("source") or "unknown")
+        docs = [f.get("doc") for f in fails if isinstance(f.get("doc"), dict)]
+        # nothing to revalidate in these, but their entry goes: keep them dead-lettered
+        for f in fails:
+            if not isinstance(f.get("doc"), dict):
+                still.setdefault(key, []).append(f)
+        for doc, (ok, why) in zip(docs, validate_batch(docs, schema)):
+            if ok:
+                inserts.setdefault(key, []).append(doc)
+            else:
+                still.setdefault(key, []).append({"doc": doc, "reason": why})
+        stats["entries"] += 1
+        stats["docs"] += len(fails)
+    now = datetime.utcnow()
+    for (job_id, source), docs in inserts.items():
+        if DEDUPE_DOCS:
+            docs = stamped(docs)
+        meta = {"_schema_version": version, "_ingest_job_id": job_id, "_ingest_ts": now, "_source": source}
+        n, insert_failed = storage.insert_many(docs, schema=schema, meta=meta)
+        stats["inserted"] += n
+        record_ingest(n, source, version, now)
+        if insert_failed:
+            send_failures(unstamped(insert_failed), "insert_failed", job_id, version, source)
+            stats["insert_failed"] += len(insert_failed)
+    for (job_id, source), fails in still.items():
+        send_failures(fails, "validation_failed", job_id, version, source)
+        stats["still_failing"] += len(fails)
+    # entries go only after their documents are stored or dead-lettered again
+    remove_entries(items)
+
+def revalidate_dlq(meta=None, storage=None, batch_size=None):
+    """
+    Revalidate validation_failed entries against meta (default: the active schema), inserting
+    through storage (the worker passes its own).
+    Returns {"version", "entries", "docs", "inserted", "insert_failed", "still_failing"}, or
+    None when another worker holds the lock.
+    """
+    meta = meta or get_latest_schema_meta()
+    if not meta or not meta.get("schema"):
+        return None
+    if not r.set(_LOCK_KEY, meta["version"], nx=True, ex=REVALIDATE_LOCK_SECS):
+        return None
+    try:
+        storage = storage or _default_storage()
+        version, schema = meta["version"], meta["schema"]
+        stats = {"version": version, "entries": 0, "docs": 0, "inserted": 0, "insert_failed": 0, "still_failing": 0}
+        # entries added from here on were already validated against this version; the cutoff
+        # is on the stream's clock (Redis time), which entry IDs are compared with
+        until = last_entry_ms()
+        cursor = None
+        while until is not None:
+            items, cursor = list_entries(reason="validation_failed", until=until, cursor=cursor, limit=batch_size or REVALIDATE_BATCH)
+            if items:
+                _revalidate_page(items, version, schema, storage, stats)
+                r.expire(_LOCK_KEY, REVALIDATE_LOCK_SECS)
+            if cursor is None:
+                break
+        storage.flush()
+        r.set(_DONE_KEY, version)
+        return stats
+    finally:
+        r.delete(_LOCK_KEY)
+
+def _announced_meta(version):
+    schema = materialize_schema(version)
+    return {"version": version, "schema": schema} if schema else None
+
+def _run(reason, version=None, storage=None):
+    t0 = time.perf_counter()
+    stats = revalidate_dlq(_announced_meta(version) if version is not None else None, storage)
+    if stats and stats["entries"]:
+        rate = stats["docs"] / (time.perf_counter() - t0)
+        print(f"[revalidate] {reason}: v{stats['version']} {stats['docs']} docs, {stats['inserted']} inserted, {stats['still_failing']} still failing ({rate:,.0f} docs/s)")
+
+def _behind(version=None):
+    """True when the announced version (or `version`) has not been revalidated yet."""
+    done = r.get(_DONE_KEY)
+    active = version if version is not None else active_version()
+    return active is not None and (done is None or int(done) != active)
+
+def _revalidate_loop(storage=None):
+    try:
+        version = active_version()
+        if version is None:
+            # nothing announced yet (older deployment): start from the active schema
+            meta = get_latest_schema_meta()
+            version = meta["version"] if meta else None
+        if version is not None and _behind(version):
+            _run("catch-up", version, storage)
+    except Exception as e:
+        print("[revalidate] catch-up failed:", e)
+    while True:
+        try:
+            for version in subscribe_version_changes(timeout=REVALIDATE_CHECK_SECS):
+                if version is not None:
+                    # the same version announced twice (approving the active one) is a no-op
+                    if _behind(version):
+                        _run(f"schema change to v{version}", version, storage)
+                elif _behind():
+                    # a change that arrived while another worker held the lock
+                    _run("catch-up", active_version(), storage)
+        except Exception as e:
+            print("[revalidate] failed:", e)
+            time.sleep(5)
+
+def start_revalidator(storage=None):
+    """
+    Revalidate the DLQ in a daemon thread on every schema change (REVALIDATE_DLQ=1), inserting
+    through storage (the worker's).
+    """
+    if not REVALIDATE_DLQ:
+        return None
+    t = threading.Thread(target=_revalidate_loop, args=(storage,), name="dlq-revalidate", daemon=True)
+    t.start()
+    return t
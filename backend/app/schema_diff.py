@@ -1,7 +1,9 @@
 # backend/app/schema_diff.py
 from dataclasses import dataclass
+from collections import OrderedDict
 from typing import Dict, Any
-import os
+import os, hashlib, threading
+import orjson
 
 # Thresholds (tune via env vars or edit here)
 ADDED_MAJOR_PCT = float(os.getenv("ADDED_MAJOR_PCT", "0.10"))        # added field >=10% of sample -> major
@@ -9,6 +11,91 @@ REMOVED_MAJOR_PREV_PCT = float(os.getenv("REMOVED_MAJOR_PREV_PCT", "0.20"))  # p
 REMOVED_MAJOR_NOW_PCT = float(os.getenv("REMOVED_MAJOR_NOW_PCT", "0.50"))    # now missing in >=50% -> major
 TYPE_SHIFT_MAJOR_PCT = float(os.getenv("TYPE_SHIFT_MAJOR_PCT", "0.50"))      # new dominant type >=50%
 
+MERKLE_CACHE_SIZE = 64
+
+class MerkleNode:
+    """
+    Structural hash of a schema subtree. children are keyed by path token: a property name
+    (rendered ".name") or ITEMS for array items (rendered "[]"). Identical subtrees have equal
+    hashes, so diffs can skip them without looking inside.
+    """
+    __slots__ = ("hash", "own", "children")
+
+    def __init__(self, spec):
+        self.children = {}
+        if isinstance(spec, dict):
+            props = spec.get("properties")
+            if isinstance(props, dict):
+                for k, v in props.items():
+                    self.children[k] = MerkleNode(v)
+            if isinstance(spec.get("items"), dict):
+                self.children[ITEMS] = MerkleNode(spec["items"])
+            own = {k: v for k, v in spec.items() if not (k in ("properties", "items") and isinstance(v, dict))}
+        else:
+            own = spec
+        self.own = hashlib.sha1(orjson.dumps(own, option=orjson.OPT_SORT_KEYS)).digest()
+        h = hashlib.sha1(self.own)
+        for k in sorted(self.children, key=_token_sort_key):
+            h.update(b"\x00" + _token_bytes(k) + b"\x00" + self.children[k].hash)
+        self.hash = h.digest()
+
+# array items token; a property may legitimately be called "[]", so use a non-string sentinel
+ITEMS = ("items",)
+
+def _token_sort_key(k):
+    return (1, "") if k is ITEMS else (0, k)
+
+def _token_bytes(k):
+    return b"\x01[]" if k is ITEMS else k.encode("utf-8", "surrogatepass")
+
+def _join(path, k):
+    if k is ITEMS:
+        return f"{path}[]"
+    return f"{path}.{k}" if path else k
+
+_merkle_cache = OrderedDict()
+_merkle_lock = threading.Lock()
+
+def merkle_tree(schema, key=None):
+    """MerkleNode for schema; cached when key (e.g. the canonical schema hash) is given."""
+    if key is None:
+        return MerkleNode(schema or {})
+    with _merkle_lock:
+        node = _merkle_cache.get(key)
+        if node is not None:
+            _merkle_cache.move_to_end(key)
+            return node
+    node = MerkleNode(schema or {})
+    with _merkle_lock:
+        _merkle_cache[key] = node
+        if len(_merkle_cache) > MERKLE_CACHE_SIZE:
+            _merkle_cache.popitem(last=False)
+    return node
+
+def merkle_diff(old, new, path=""):
+    """
+    Diff two MerkleNodes into {"added": [...], "removed": [...], "changed": [...]} nested paths
+    such as "a.b[].c". Only descends into subtrees whose hashes differ, so the work is
+    proportional to what changed.
+    """
+    out = {"added": [], "removed": [], "changed": []}
+    _merkle_walk(old, new, path, out)
+    return out
+
+def _merkle_walk(old, new, path, out):
+    if old.hash == new.hash:
+        return
+    if path and old.own != new.own:
+        out["changed"].append(path)
+    for k, child in new.children.items():
+        if k not in old.children:
+            out["added"].append(_join(path, k))
+        elif old.children[k].hash != child.hash:
+            _merkle_walk(old.children[k], child, _join(path, k), out)
+    for k in old.children:
+        if k not in new.children:
+            out["removed"].append(_join(path, k))
+
 @dataclass
 class Diff:
     added: Dict[str, Any]
@@ -22,9 +109,11 @@ class Decision:
 
 class SchemaDriftDetector:
     @staticmethod
-    def compute_diff(old_schema: Dict[str, Any], new_schema: Dict[str, Any], field_stats: Dict[str,Any], latest_meta=None):
+    def compute_diff(old_schema: Dict[str, Any], new_schema: Dict[str, Any], field_stats: Dict[str,Any], latest_meta=None, old_key=None, new_key=None):
         """
-        Return Diff with metadata: for added fields include present count; for changed include new_dom_pct; removed include prev_presence.
+        Return Diff with metadata: for added fields include present count; for changed include new_dom_pct
+        and the nested paths that changed; removed include prev_presence.
+        old_key/new_key (canonical schema hashes) let the Merkle trees be cached across calls.
         """
         if not old_schema:
             # everything added
@@ -34,6 +123,8 @@ class SchemaDriftDetector:
 
         old_props = old_schema.get("properties", {}) or {}
         new_props = new_schema.get("properties", {}) or {}
+        old_tree = merkle_tree(old_schema, old_key)
+        new_tree = merkle_tree(new_schema, new_key)
 
         added = {}
         removed = {}
@@ -44,7 +135,7 @@ class SchemaDriftDetector:
             if k not in old_props:
                 added[k] = {"present": field_stats.get(k,{}).get("present",0), "present_pct": field_stats.get(k,{}).get("present_pct",0)}
             else:
-                if old_props[k] != v:
+                if old_tree.children[k].hash != new_tree.children[k].hash:
                     # determine new dominant type pct if available
                     tc = field_stats.get(k,{}).get("type_counts",{})
                     total = sum(tc.values()) if tc else 0
@@ -52,7 +143,8 @@ class SchemaDriftDetector:
                     if total > 0:
                         new_type = max(tc, key=lambda x: tc[x])
                         new_dom_pct = tc[new_type] / total
-                    changed[k] = {"old": old_props[k], "new": v, "new_dom_pct": new_dom_pct}
+                    paths = merkle_diff(old_tree.children[k], new_tree.children[k], k)
+                    changed[k] = {"old": old_props[k], "new": v, "new_dom_pct": new_dom_pct, "paths": paths}
 
         # removed
         for k, v in old_props.items():
@@ -0,0 +1,56 @@
+# backend/app/schema_patch.py
+"""
+Minimal JSON Patch (RFC 6902) support for schema history.
+make_patch(old, new) emits add/remove/replace ops (objects are diffed key by key, anything else is
+replaced whole); apply_patch(doc, ops) returns a new document and never mutates its input.
+"""
+import copy
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+def make_patch(old, new, path=""):
+    if type(old) is dict and type(new) is dict:
+        ops = []
+        for k in old:
+            if k not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(k)}"})
+        for k, v in new.items():
+            p = f"{path}/{_escape(k)}"
+            if k not in old:
+                ops.append({"op": "add", "path": p, "value": v})
+            elif old[k] != v or type(old[k]) is not type(v):
+                ops.extend(make_patch(old[k], v, p))
+        return ops
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+def apply_patch(doc, ops):
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            # whole-document replace
+            doc = copy.deepcopy(op["value"])
+            continue
+        parent = doc
+        for t in tokens[:-1]:
+            parent = parent[int(t)] if isinstance(parent, list) else parent[t]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            idx = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(idx, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del parent[idx]
+            else:
+                parent[idx] = copy.deepcopy(op["value"])
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op["value"])
+    return doc
@@ -1,15 +1,311 @@
 # backend/app/storage.py
-from pymongo import MongoClient
-import os
+from abc import ABC, abstractmethod
+from pymongo.errors import BulkWriteError, DocumentTooLarge, InvalidDocument, DuplicateKeyError, PyMongoError
+from bson import encode as bson_encode, ObjectId
+from bson.errors import InvalidId
+from bson.raw_bson import RawBSONDocument
+from concurrent.futures import ThreadPoolExecutor
+import os, struct, threading
+from .partitions import partition_name, RawDataRouter, RAW_PARTITION_MODE
+from .indexes import ensure_collection_indexes
+from .parquet_sink import get_sink
+from .dedupe import DocDeduper, DEDUPE_DOCS
+from .blobstore import externalize, EXTERNALIZE_BYTES
+from .mongo import mongo_db
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-client = MongoClient(MONGO_URL)
-db = client["chrysalis"]
-RAW_COLLECTION = db["raw_data"]
+INSERT_CHUNK_SIZE = int(os.getenv("INSERT_CHUNK_SIZE", "1000"))
+INSERT_WORKERS = int(os.getenv("INSERT_WORKERS", "4"))
+RAW_BSON_INSERT = os.getenv("RAW_BSON_INSERT", "1") == "1"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
 
-class StorageManager:
-    def insert_many(self, docs):
+
+_INT32 = struct.Struct("<i")
+_ID_ELEMENT = b"\x07_id\x00"  # ObjectId element header
+
+def encode_meta(meta):
+    """BSON elements (no length prefix, no terminator) for the per-job metadata; encode once per job."""
+    return bson_encode(meta)[4:-1]
+
+def to_raw_bson(doc, meta_elements, oid=None):
+    """
+    BSON for doc with the metadata elements appended, spliced at the byte level instead of
+    copying or mutating the dict. Adds an ObjectId _id (oid or a new one) when the doc has none.
+    doc must not hold any of the metadata keys (BSON would carry them twice).
+    """
+    body = bson_encode(doc)
+    tail = meta_elements if "_id" in doc else meta_elements + _ID_ELEMENT + (oid or ObjectId()).binary
+    return RawBSONDocument(b"".join((_INT32.pack(len(body) + len(tail)), body[4:-1], tail, b"\x00")))
+
+class StorageBackend(ABC):
+    """
+    What the worker, the API metrics and the benchmarks need from a raw document store.
+    StorageManager (Mongo) is the default; embedded_storage has SQLite (JSON1) and DuckDB
+    implementations. The worker shares its instance with DLQ revalidation, so insert_many and
+    flush may run on two threads at once.
+    """
+    last_skipped = 0
+
+    @abstractmethod
+    def insert_many(self, docs, schema=None, meta=None):
+        """Insert docs; returns (inserted_count, [{"doc": doc, "reason": ...}, ...])."""
+
+    def flush(self, idle=False):
+        pass
+
+    @abstractmethod
+    def count(self, version=None):
+        """Number of stored docs (of one schema version)."""
+
+    @abstractmethod
+    def find(self, flt=None, limit=0):
+        """Docs matching top-level equality filters, newest first."""
+
+    @abstractmethod
+    def get(self, doc_id, rehydrate=True):
+        """One doc by its id as the API shows it (str); None if unknown, ValueError if malformed."""
+
+    @abstractmethod
+    def ingest_counts(self, since, bucket_mins=1, source=None, version=None):
+        """
+        {bucket_start_iso: docs} ingested since `since`, in bucket_mins buckets aligned to the hour,
+        optionally only of one source and/or schema version.
+        """
+
+class StorageManager(StorageBackend):
+    def __init__(self, collection=None, chunk_size=None, workers=None, partition_mode=None):
+        # an explicit collection disables partition routing
+        self.collection = collection if collection is not None else mongo_db()["raw_data"]
+        self.partition_mode = "none" if collection is not None else (partition_mode or RAW_PARTITION_MODE)
+        self.chunk_size = chunk_size or INSERT_CHUNK_SIZE
+        workers = workers or INSERT_WORKERS
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._indexed = set()
+        self._lock = threading.Lock()
+        # optional columnar copy of what lands in Mongo (PARQUET_SINK_DIR)
+        self.sink = get_sink() if collection is None else None
+        # DEDUPE_DOCS: skip documents whose _doc_hash is already stored
+        self.deduper = DocDeduper(
+            RawDataRouter(self.collection.database),
+            cross_partition=self.partition_mode != "none",
+        ) if DEDUPE_DOCS and collection is None else None
+        self.last_skipped = 0
+        self.reader = RawDataRouter(self.collection.database, names=None if collection is None else [self.collection.name])
+
+    def _route(self, docs, meta=None):
+        """Group docs by target collection (from _schema_version/_ingest_ts)."""
+        if self.partition_mode == "none":
+            return {self.collection.name: docs}
+        if meta is not None:
+            # one job, one version, one timestamp: one partition
+            return {partition_name(meta.get("_schema_version"), meta.get("_ingest_ts"), self.partition_mode): docs}
+        groups = {}
+        for d in docs:
+            name = partition_name(d.get("_schema_version"), d.get("_ingest_ts"), self.partition_mode)
+            groups.setdefault(name, []).append(d)
+        return groups
+
+    def _target(self, name):
+        coll = self.collection.database[name]
+        if name not in self._indexed:
+            with self._lock:
+                if name not in self._indexed:
+                    # new partitions get the raw_data indexes before their first write
+                    ensure_collection_indexes(coll, "raw_data")
+                    self._indexed.add(name)
+        return coll
+
+    def insert_many(self, docs, schema=None, meta=None):
+        """
+        Unordered insert in chunks of chunk_size, chunks written concurrently, each document to
+        its partition. A bad document no longer aborts the batch: returns (inserted_count, failed)
+        where failed is [{"doc": doc, "reason": "insert_failed:<code>:<message>"}, ...].
+        meta is the per-job metadata (_schema_version/_ingest_job_id/_ingest_ts/_source); with
+        RAW_BSON_INSERT it is encoded once and appended to each document's BSON, otherwise it is
+        set on the dicts. schema types the Parquet columns when the sink is enabled.
+        With DEDUPE_DOCS, duplicates are neither inserted nor reported as failed; their number is
+        left in last_skipped.
+        """
+        self.last_skipped = 0
+        if self.deduper is not None:
+            docs, self.last_skipped = self.deduper.filter(docs)
         if not docs:
-            return 0
-        res = RAW_COLLECTION.insert_many(docs)
-        return len(res.inserted_ids)
+            return 0, []
+        failed = []
+        chunks = []
+        ids = {} if self.sink is not None else None
+        for name, group in self._route(docs, meta).items():
+            coll = self.collection if self.partition_mode == "none" else self._target(name)
+            payload = group
+            if meta is not None and RAW_BSON_INSERT:
+                group, payload, failed_encode = self._encode_raw(group, encode_meta(meta), ids, meta.keys())
+                failed.extend(failed_encode)
+            elif meta is not None:
+                # copies: failed docs go to the DLQ as they arrived, without the job metadata
+                payload = []
+                for d in group:
+                    c = {**d, **meta}
+                    if ids is not None and "_id" not in c:
+                        c["_id"] = ids[id(d)] = ObjectId()
+                    payload.append(c)
+                if EXTERNALIZE_BYTES:
+                    payload, failed_ext = self._externalize_dicts(payload, group)
+                    failed.extend(failed_ext)
+                    group = [d for d, p in zip(group, payload) if p is not None]
+                    payload = [p for p in payload if p is not None]
+            chunks.extend(
+                (coll, payload[i:i + self.chunk_size], group[i:i + self.chunk_size])
+                for i in range(0, len(group), self.chunk_size)
+            )
+        if self._pool is not None and len(chunks) > 1:
+            results = list(self._pool.map(lambda c: self._insert_chunk(*c), chunks))
+        else:
+            results = [self._insert_chunk(*c) for c in chunks]
+        inserted = sum(n for n, _ in results)
+        failed.extend(f for _, fs in results for f in fs)
+        rejected = {id(f["doc"]) for f in failed}
+        if self.deduper is not None:
+            dups = [f for f in failed if f.get("duplicate")]
+            if dups:
+                failed = [f for f in failed if not f.get("duplicate")]
+                self.last_skipped += len(dups)
+            self.deduper.remember(d for d in docs if id(d) not in rejected)
+        for f in failed:
+            f.pop("duplicate", None)
+        if self.sink is not None:
+            try:
+                self.sink.write([d for d in docs if id(d) not in rejected], schema, meta, ids)
+            except Exception as e:
+                # Mongo is the source of truth; a sink failure must not fail the job
+                print("[parquet] sink write failed:", e)
+        return inserted, failed
+
+    def count(self, version=None):
+        if version is None:
+            return self.reader.count_documents({})
+        return self.reader.count_documents({"_schema_version": version}, versions=[version])
+
+    def find(self, flt=None, limit=0):
+        prune = {}
+        if flt and "_schema_version" in flt:
+            prune["versions"] = [flt["_schema_version"]]
+        return self.reader.find(flt or {}, sort=[("_id", -1)], limit=limit, **prune)
+
+    def get(self, doc_id, rehydrate=True):
+        try:
+            oid = ObjectId(doc_id)
+        except InvalidId as e:
+            raise ValueError(str(e))
+        docs = self.reader.find({"_id": oid}, limit=1, rehydrate=rehydrate)
+        return docs[0] if docs else None
+
+    def ingest_counts(self, since, bucket_mins=1, source=None, version=None):
+        return self.reader.ingest_counts(since, bucket_mins, source, version)
+
+    def _encode_raw(self, docs, meta_elements, ids=None, meta_keys=()):
+        """
+        (encoded docs, their RawBSONDocuments, failures for docs BSON cannot represent).
+        ids, when given, collects the generated _id per id(doc) for the Parquet sink. Doc fields
+        named like a metadata key (meta_keys) are dropped: the job metadata wins, as on the
+        dict path.
+        """
+        kept, raw, failed = [], [], []
+        for d in docs:
+            try:
+                oid = None
+                if ids is not None and "_id" not in d:
+                    oid = ids[id(d)] = ObjectId()
+                src = {k: v for k, v in d.items() if k not in meta_keys} if d.keys() & meta_keys else d
+                doc = to_raw_bson(src, meta_elements, oid)
+                if EXTERNALIZE_BYTES and len(doc.raw) > EXTERNALIZE_BYTES:
+                    doc = to_raw_bson(externalize(src, len(doc.raw)), meta_elements, oid)
+                raw.append(doc)
+                kept.append(d)
+            except (InvalidDocument, OverflowError) as e:
+                failed.append(_failure(d, True, None, f"{type(e).__name__}: {e}"))
+            except Exception as e:
+                failed.append(_failure(d, True, "externalize_failed", str(e)))
+        return kept, raw, failed
+
+    def _externalize_dicts(self, docs, originals):
+        """
+        Dict path: compact reference docs for the oversized ones (None where the blob store
+        failed). Failures report the matching originals.
+        """
+        payload, failed = [], []
+        for d, orig in zip(docs, originals):
+            try:
+                size = len(bson_encode(d))
+                payload.append(externalize(d, size) if size > EXTERNALIZE_BYTES else d)
+            except (InvalidDocument, OverflowError):
+                # left for the insert to report
+                payload.append(d)
+            except Exception as e:
+                failed.append(_failure(orig, True, "externalize_failed", str(e)))
+                payload.append(None)
+        return payload, failed
+
+    def flush(self, idle=False):
+        """Close open Parquet files (only those past PARQUET_FLUSH_SECS when idle=True)."""
+        if self.sink is None:
+            return
+        try:
+            self.sink.maybe_flush() if idle else self.sink.flush()
+        except Exception as e:
+            print("[parquet] sink flush failed:", e)
+
+    def _insert_chunk(self, collection, chunk, originals):
+        # chunk is what goes to the server (dicts or RawBSONDocuments), originals the docs to
+        # report on failure. pymongo assigns _id in place on dicts; remember which ids were
+        # ours so failed docs go to the DLQ as they arrived
+        had_id = [("_id" in d) for d in originals]
+        try:
+            res = collection.insert_many(chunk, ordered=False)
+            return len(res.inserted_ids), []
+        except BulkWriteError as e:
+            failed = [
+                _failure(originals[err["index"]], had_id[err["index"]], err.get("code"), err.get("errmsg", ""), err.get("keyPattern"))
+                for err in e.details.get("writeErrors", [])
+            ]
+            return e.details.get("nInserted", 0), failed
+        except (DocumentTooLarge, InvalidDocument):
+            # raised client-side, possibly after earlier sub-batches were sent: isolate one by one
+            return self._insert_one_by_one(collection, chunk, originals, had_id)
+
+    def _insert_one_by_one(self, collection, chunk, originals, had_id):
+        inserted, failed = 0, []
+        for doc, orig, own_id in zip(chunk, originals, had_id):
+            try:
+                collection.insert_one(doc)
+                inserted += 1
+            except DuplicateKeyError as e:
+                if not own_id and "_id" in ((e.details or {}).get("keyPattern") or {}):
+                    # our generated _id already went in with the partial batch
+                    inserted += 1
+                else:
+                    failed.append(_failure(orig, own_id, e.code, str(e), (e.details or {}).get("keyPattern")))
+            except (DocumentTooLarge, InvalidDocument) as e:
+                failed.append(_failure(orig, own_id, None, f"{type(e).__name__}: {e}"))
+            except PyMongoError as e:
+                failed.append(_failure(orig, own_id, getattr(e, "code", None), str(e)))
+        return inserted, failed
+
+def _failure(doc, had_id, code, message, key_pattern=None):
+    if not had_id:
+        doc.pop("_id", None)
+    failure = {"doc": doc, "reason": f"insert_failed:{code}:{message[:200]}"}
+    if code == 11000 and ("_doc_hash" in (key_pattern or {}) or "index: _doc_hash_1 " in message):
+        # same content already stored (DEDUPE_DOCS); insert_many drops these
+        failure["duplicate"] = True
+    return failure
+
+def get_storage(backend=None, **kwargs):
+    """StorageBackend for STORAGE_BACKEND: mongo (default), sqlite or duckdb."""
+    backend = backend or STORAGE_BACKEND
+    if backend == "mongo":
+        return StorageManager(**kwargs)
+    from .embedded_storage import SQLiteStorage, DuckDBStorage
+    if backend == "sqlite":
+        return SQLiteStorage(**kwargs)
+    if backend == "duckdb":
+        return DuckDBStorage(**kwargs)
+    raise ValueError(f"unknown STORAGE_BACKEND {backend!r}")
@@ -0,0 +1,117 @@
+# backend/app/typed_decoder.py
+"""
+Typed decoders generated from registered schemas.
+
+For each schema version we build a msgspec Struct type mirroring the validator's shape checks
+(required fields + integer/number/string/object/array types). The worker decodes the job once
+(decode_job) and msgspec.convert type-checks all of its documents against that Struct in one
+C-level pass over the already-decoded objects, without parsing the payload again. When a
+document is rejected, the remaining ones are converted one by one and only the rejected
+documents go through the Python path (CompiledSchema.validate).
+
+The decoder is never stricter than the Python path in what it lets through: anything it rejects
+(integer-valued floats, non-object docs, ...) is simply re-checked in Python.
+Value keywords (enum/pattern/min/max/...) are still checked by CompiledSchema.check_values.
+
+msgspec is optional; without it get_decoder returns None, jobs are decoded with orjson and the
+worker keeps the Python path.
+"""
+import re
+from typing import Any
+
+import orjson
+
+try:
+    import msgspec
+except ImportError:  # optional dependency
+    msgspec = None
+
+from .validator import schema_hash, compile_schema, validate_batch
+
+DECODER_CACHE_SIZE = 64
+
+_JSON_TO_PY = {"integer": int, "number": float, "string": str, "object": dict, "array": list}
+_DOC_INDEX_RE = re.compile(r"\$\[(\d+)\]")
+
+# schema_hash -> (docs_type, doc_type)
+_decoders = {}
+
+def decode_job(raw_msg_bytes):
+    """The job payload as Python objects: the one JSON parse a job goes through."""
+    if msgspec is None:
+        return orjson.loads(raw_msg_bytes)
+    return msgspec.json.decode(raw_msg_bytes)
+
+def build_decoder(schema, key=None):
+    """
+    Generate (and cache) the msgspec.convert targets for schema: (docs_type, doc_type).
+    docs_type type-checks a whole "documents" list, doc_type a single document.
+    """
+    if msgspec is None or not schema:
+        return None
+    key = key or schema_hash(schema)
+    props = schema.get("properties") or {}
+    required = set(schema.get("required") or [])
+    fields, rename = [], {}
+    for i, (k, spec) in enumerate(props.items()):
+        exp = spec.get("type") if isinstance(spec, dict) else None
+        typ = _JSON_TO_PY.get(exp, Any) if isinstance(exp, str) else Any
+        # untyped fields are not checked (Any); field names need not be identifiers, so use
+        # positional names and rename to the document keys
+        name = f"f{i}"
+        rename[name] = k
+        if k in required:
+            fields.append((name, typ))
+        else:
+            fields.append((name, typ, None))
+    for i, k in enumerate(sorted(required - set(props))):
+        name = f"r{i}"
+        rename[name] = k
+        fields.append((name, Any))
+    doc_type = msgspec.defstruct("Doc", fields, rename=rename, kw_only=True, gc=False)
+    decoders = (list[doc_type], doc_type)
+    _decoders[key] = decoders
+    if len(_decoders) > DECODER_CACHE_SIZE:
+        _decoders.pop(next(iter(_decoders)))
+    return decoders
+
+def get_decoder(schema, key=None):
+    if msgspec is None or not schema:
+        return None
+    key = key or schema_hash(schema)
+    decoders = _decoders.get(key)
+    if decoders is None:
+        decoders = build_decoder(schema, key)
+    return decoders
+
+def validate_docs(docs, schema):
+    """
+    Same result as validate_batch(docs, schema) for the decoded "documents" array of a job.
+    Returns [(ok, reason), ...] aligned with docs.
+    """
+    key = schema_hash(schema)
+    decoders = get_decoder(schema, key)
+    if decoders is None:
+        return validate_batch(docs, schema)
+    docs_type, doc_type = decoders
+    compiled = compile_schema(schema, key)
+    check = compiled.check_values if compiled.value_checks else None
+    try:
+        msgspec.convert(docs, docs_type)
+        if check is None:
+            return [(True, None)] * len(docs)
+        return [check(doc) for doc in docs]
+    except msgspec.ValidationError as e:
+        m = _DOC_INDEX_RE.search(str(e))
+        first_bad = int(m.group(1)) if m else 0
+
+    # everything before the first rejection passed; type-check the rest one document at a time
+    results = [check(doc) for doc in docs[:first_bad]] if check else [(True, None)] * first_bad
+    for doc in docs[first_bad:]:
+        try:
+            msgspec.convert(doc, doc_type)
+        except msgspec.ValidationError:
+            results.append(compiled.validate(doc))
+            continue
+        results.append(check(doc) if check else (True, None))
+    return results
@@ -20,11 +20,35 @@ Policy implemented (recommended):
 
 - PROMOTE_PCT default = 0.9 (90% of sample docs must conform to candidate schema).
 
-- This file exposes: validate_doc_against_schema(doc, schema), decide_promotion(latest, candidate, sample_stats)
+- This file exposes: validate_doc_against_schema(doc, schema), validate_batch(docs, schema), decide_promotion(latest, candidate, sample_stats),
+
+  schema_hash(schema) (canonical hash; schemas are compared by hash, never by full serialization)
+
+
+
+Shape memoization:
+
+- A document's shape is its key set plus the value type per key. The type checks below only
+
+  depend on the shape, so validate_batch caches (ok, reason) per (schema hash, shape) in a
+
+  bounded LRU (SHAPE_CACHE_SIZE entries) and repeated shapes skip the per-field checks.
+
+- Integer-valued floats are the one value-dependent case ("integer" accepts 3.0 but not 3.5);
+
+  they get their own type tag in the signature so both outcomes are cached separately.
+
+- Value keywords (enum, pattern, minimum/maximum, exclusiveMinimum/Maximum, minLength/maxLength,
+
+  format: date-time) are compiled once per schema (see compile_schema) and checked per document
+
+  after the shape check passes.
 
 """
 
-import os, orjson
+import os, re, orjson, hashlib, threading
+
+from collections import OrderedDict
 
 from datetime import datetime
 
@@ -36,6 +60,32 @@ REQUIRED_PCT = float(os.getenv("REQUIRED_PCT", "0.9"))
 
 PROMOTE_BURST = os.getenv("PROMOTE_BURST", "False").lower() in ("true", "1", "yes")
 
+SHAPE_CACHE_SIZE = int(os.getenv("SHAPE_CACHE_SIZE", "4096"))
+
+COMPILED_CACHE_SIZE = 64
+
+
+
+# (schema_hash, shape_signature) -> (ok, reason), least recently used first
+
+_shape_cache = OrderedDict()
+
+_shape_lock = threading.Lock()
+
+_shape_stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+_INTEGRAL_FLOAT = "integral_float"
+
+# schema_hash -> CompiledSchema
+
+_compiled_cache = OrderedDict()
+
+_DATE_TIME_RE = re.compile(
+
+    r"^(\d{4})-(\d{2})-(\d{2})[Tt](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?(?:[Zz]|[+-](\d{2}):(\d{2}))$"
+
+)
+
 
 
 def _pytype_to_json_type(val):
@@ -74,12 +124,288 @@ def _pytype_to_json_type(val):
 
 
 
-def validate_doc_against_schema(doc, schema):
+def schema_hash(schema):
+
+    """Canonical (key-order-insensitive) hash of a schema; None for an empty schema."""
+
+    if not schema:
+
+        return None
+
+    return hashlib.sha1(orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+
+def _shape_signature(doc):
+
+    sig = []
+
+    for k, v in doc.items():
+
+        t = type(v)
+
+        if t is float and v.is_integer():
+
+            t = _INTEGRAL_FLOAT
+
+        sig.append((k, t))
+
+    return tuple(sig)
+
+
+
+def _is_number(val):
+
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+
+def _enum_key(val):
+
+    # JSON equality: 1 == 1.0 but True != 1, and objects/arrays compare by content
+
+    if isinstance(val, bool):
+
+        return ("boolean", val)
+
+    if isinstance(val, (int, float)):
+
+        return ("number", val)
+
+    if isinstance(val, (dict, list)):
+
+        return ("json", orjson.dumps(val, option=orjson.OPT_SORT_KEYS))
+
+    return (type(val).__name__, val)
+
+
+
+def _is_date_time(val):
+
+    m = _DATE_TIME_RE.match(val)
+
+    if not m:
+
+        return False
+
+    year, month, day, hour, minute, second = (int(g) for g in m.groups()[:6])
+
+    try:
+
+        # second=60 is a legal leap second in RFC 3339
+
+        datetime(year, month, day, hour, minute, min(second, 59))
+
+    except ValueError:
+
+        return False
+
+    tz_hour, tz_minute = m.group(7), m.group(8)
+
+    return tz_hour is None or (int(tz_hour) <= 23 and int(tz_minute) <= 59)
+
+
+
+_FORMAT_CHECKERS = {
+
+    "date-time": _is_date_time,
+
+}
+
+
+
+def _compile_value_checks(k, spec):
+
+    """Build (field, keyword, check) triples for the value-dependent keywords of one property."""
+
+    checks = []
+
+    if "enum" in spec:
+
+        allowed = frozenset(_enum_key(v) for v in spec["enum"])
+
+        checks.append((k, "enum", lambda v: _enum_key(v) in allowed))
+
+    if "pattern" in spec:
+
+        rx = re.compile(spec["pattern"])
+
+        checks.append((k, "pattern", lambda v: not isinstance(v, str) or rx.search(v) is not None))
+
+    if "minLength" in spec:
+
+        min_len = spec["minLength"]
+
+        checks.append((k, "minLength", lambda v: not isinstance(v, str) or len(v) >= min_len))
+
+    if "maxLength" in spec:
+
+        max_len = spec["maxLength"]
+
+        checks.append((k, "maxLength", lambda v: not isinstance(v, str) or len(v) <= max_len))
+
+    if "minimum" in spec:
+
+        minimum = spec["minimum"]
+
+        checks.append((k, "minimum", lambda v: not _is_number(v) or v >= minimum))
+
+    if "maximum" in spec:
+
+        maximum = spec["maximum"]
+
+        checks.append((k, "maximum", lambda v: not _is_number(v) or v <= maximum))
+
+    if _is_number(spec.get("exclusiveMinimum")):
+
+        ex_min = spec["exclusiveMinimum"]
+
+        checks.append((k, "exclusiveMinimum", lambda v: not _is_number(v) or v > ex_min))
+
+    if _is_number(spec.get("exclusiveMaximum")):
+
+        ex_max = spec["exclusiveMaximum"]
+
+        checks.append((k, "exclusiveMaximum", lambda v: not _is_number(v) or v < ex_max))
+
+    fmt = _FORMAT_CHECKERS.get(spec.get("format"))
+
+    if fmt is not None:
+
+        checks.append((k, "format", lambda v: not isinstance(v, str) or fmt(v)))
+
+    return checks
+
+
+
+class CompiledSchema:
+
+    """
+
+    Validation plan for one schema version.
+
+    Type/required checks depend only on the document shape and are memoized in the shape
+
+    cache; enum/pattern/min/max/length/format checks depend on values and run per document.
+
+    """
+
+    def __init__(self, schema, key=None):
+
+        self.schema = schema
+
+        self.key = key or schema_hash(schema)
+
+        self.value_checks = []
+
+        for k, spec in (schema.get("properties") or {}).items():
+
+            if isinstance(spec, dict):
+
+                self.value_checks.extend(_compile_value_checks(k, spec))
+
+
+
+    def check_shape(self, doc):
+
+        if not isinstance(doc, dict):
+
+            _shape_stats["uncached"] += 1
+
+            return _check_doc(doc, self.schema)
+
+        key = (self.key, _shape_signature(doc))
+
+        with _shape_lock:
+
+            result = _shape_cache.get(key)
+
+            if result is not None:
+
+                _shape_cache.move_to_end(key)
+
+                _shape_stats["hits"] += 1
+
+                return result
+
+            _shape_stats["misses"] += 1
+
+        result = _check_doc(doc, self.schema)
+
+        with _shape_lock:
+
+            _shape_cache[key] = result
+
+            if len(_shape_cache) > SHAPE_CACHE_SIZE:
+
+                _shape_cache.popitem(last=False)
+
+        return result
+
+
+
+    def check_values(self, doc):
+
+        for k, keyword, check in self.value_checks:
+
+            if k in doc and not check(doc[k]):
+
+                return False, f"constraint_failed:{k}:{keyword}"
+
+        return True, None
+
+
+
+    def validate(self, doc):
+
+        ok, reason = self.check_shape(doc)
+
+        if not ok or not self.value_checks or not isinstance(doc, dict):
+
+            return ok, reason
+
+        return self.check_values(doc)
+
+
+
+def compile_schema(schema, schema_key=None):
+
+    """Return the cached CompiledSchema for schema (regexes, enum sets and format checkers built once)."""
+
+    key = schema_key or schema_hash(schema)
+
+    with _shape_lock:
+
+        compiled = _compiled_cache.get(key)
+
+        if compiled is not None:
+
+            _compiled_cache.move_to_end(key)
+
+            return compiled
+
+    compiled = CompiledSchema(schema, key)
+
+    with _shape_lock:
+
+        _compiled_cache[key] = compiled
+
+        if len(_compiled_cache) > COMPILED_CACHE_SIZE:
+
+            _compiled_cache.popitem(last=False)
+
+    return compiled
+
+
+
+def validate_doc_against_schema(doc, schema, schema_key=None):
 
     """
 
     Strong validation against given schema (best-effort).
 
+    schema_key (see schema_hash) saves re-hashing the schema when the caller already has it.
+
     Returns (ok:bool, reason:str or None).
 
     """
@@ -88,6 +414,44 @@ def validate_doc_against_schema(doc, schema):
 
         return True, None
 
+    return compile_schema(schema, schema_key).validate(doc)
+
+
+
+def validate_batch(docs, schema):
+
+    """Validate a list of docs against one schema; returns [(ok, reason), ...] aligned with docs."""
+
+    if not schema:
+
+        return [(True, None)] * len(docs)
+
+    validate = compile_schema(schema).validate
+
+    return [validate(doc) for doc in docs]
+
+
+
+def shape_cache_stats():
+
+    """Hit/miss counters of the shape cache since process start."""
+
+    looked_up = _shape_stats["hits"] + _shape_stats["misses"]
+
+    return {
+
+        **_shape_stats,
+
+        "size": len(_shape_cache),
+
+        "hit_rate": (_shape_stats["hits"] / looked_up) if looked_up else 0.0,
+
+    }
+
+
+
+def _check_doc(doc, schema):
+
     props = schema.get("properties", {})
 
     required = schema.get("required", [])
@@ -148,7 +512,7 @@ def validate_doc_against_schema(doc, schema):
 
 
 
-def decide_promotion(latest_schema, candidate_schema, sample_field_stats):
+def decide_promotion(latest_schema, candidate_schema, sample_field_stats, latest_hash=None, candidate_hash=None):
 
     """
 
@@ -156,6 +520,8 @@ def decide_promotion(latest_schema, candidate_schema, sample_field_stats):
 
     sample_field_stats: dict mapping field -> {'present':count, 'present_pct':float}
 
+    latest_hash/candidate_hash: canonical schema hashes, if the caller already has them.
+
     Rule: Promote if (1) candidate != latest AND (2) all fields in candidate are present in >= PROMOTE_PCT of sample docs.
 
     Returns (promote:bool, reasons:list)
@@ -170,7 +536,7 @@ def decide_promotion(latest_schema, candidate_schema, sample_field_stats):
 
         return True, reasons
 
-    if orjson.dumps(latest_schema) == orjson.dumps(candidate_schema):
+    if (latest_hash or schema_hash(latest_schema)) == (candidate_hash or schema_hash(candidate_schema)):
 
         reasons.append("schemas_equal")
 
@@ -1,12 +1,24 @@
 # backend/app/versioning.py
 
-import os
+import os, time, threading
+
+from collections import OrderedDict
 
 from datetime import datetime
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+
+from pymongo.errors import DuplicateKeyError
+
+from .typed_decoder import build_decoder
+
+from .validator import schema_hash
+
+from .events import publish_version_change
 
-import orjson
+from .schema_patch import make_patch, apply_patch
+
+from .indexes import ensure_indexes
 
 
 
@@ -18,61 +30,625 @@ db = client.get_database("chrysalis")
 
 
 
+# how long a worker that lost a promotion race waits for the winner's registry doc
+
+PROMOTE_WAIT_SECS = float(os.getenv("PROMOTE_WAIT_SECS", "2"))
+
+# a claimed version number with no registry doc after this long is taken as abandoned
+
+PROMOTE_CLAIM_STALE_SECS = float(os.getenv("PROMOTE_CLAIM_STALE_SECS", "60"))
+
+# registry entries store a JSON-patch delta against their parent; every Nth link is a full snapshot
+
+SCHEMA_SNAPSHOT_EVERY = int(os.getenv("SCHEMA_SNAPSHOT_EVERY", "10"))
+
+MATERIALIZE_CACHE_SIZE = 256
+
+
+
 _registry = db.schema_registry
 
-# simple incremental integer versioning
+# bulky per-version data (sample_docs, field_stats), keyed by version; kept off the hot lookup path
+
+_details = db.schema_registry_details
+
+# small bookkeeping docs (version counter, active schema pointer)
+
+_state = db.registry_state
+
+VERSION_COUNTER_ID = "version_counter"
+
+ACTIVE_SCHEMA_ID = "active_schema"
+
+# what hot paths read from a registry entry
+
+HOT_FIELDS = {"version": 1, "schema": 1, "schema_hash": 1, "created_at": 1, "delta_depth": 1}
+
+_counter_ready = False
+
+# version -> fully materialized schema
+
+_materialized = OrderedDict()
+
+_materialized_lock = threading.Lock()
+
+
+
+def _ensure_registry(force=False):
+
+    """
+
+    Idempotent registry setup: backfill schema_hash on old entries, move their samples/stats
+
+    to the details collection, create the schema_registry indexes (indexes.INDEX_SPECS), and
+
+    seed the version counter from the registry.
+
+    """
+
+    global _counter_ready
+
+    if _counter_ready and not force:
+
+        return
+
+    for doc in _registry.find({"schema_hash": {"$exists": False}}, {"schema": 1}):
+
+        _registry.update_one({"_id": doc["_id"]}, {"$set": {"schema_hash": schema_hash(doc.get("schema"))}})
 
-def _next_version():
+    for doc in _registry.find({"sample_docs": {"$exists": True}}, {"version": 1, "sample_docs": 1, "field_stats": 1}):
 
-    last = _registry.find_one(sort=[("version", -1)])
+        _details.update_one(
 
-    return (last["version"] + 1) if last else 1
+            {"_id": doc["version"]},
+
+            {"$setOnInsert": {"sample_docs": doc.get("sample_docs"), "field_stats": doc.get("field_stats")}},
+
+            upsert=True,
+
+        )
+
+        _registry.update_one(
+
+            {"_id": doc["_id"]},
+
+            {"$unset": {"sample_docs": "", "field_stats": "", "diff.field_stats_sample": ""}},
+
+        )
+
+    names = ensure_indexes(db, collections=["schema_registry"]).get("schema_registry", [])
+
+    if "version_1" not in names:
+
+        # promotions are only race-free with it; registries from before the CAS may hold duplicates
+
+        raise RuntimeError(
+
+            "schema_registry.version_1 unique index is missing (duplicate versions?); "
+
+            "resolve the duplicates before promoting schemas"
+
+        )
+
+    if "schema_hash_1" not in names:
+
+        # registries created before hashing may hold duplicate schemas; lookups only need an index
+
+        print("[versioning] schema_hash index not unique")
+
+        _registry.create_index("schema_hash")
+
+    last = _registry.find_one(sort=[("version", -1)], projection={"version": 1})
+
+    # $max never moves the counter backwards, so concurrent seeding is harmless
+
+    _state.update_one(
+
+        {"_id": VERSION_COUNTER_ID},
+
+        {"$max": {"seq": last["version"] if last else 0}},
+
+        upsert=True,
+
+    )
+
+    _counter_ready = True
 
 
 
 def get_latest_schema_meta():
 
-    """Return the latest schema metadata doc or None."""
+    """
+
+    Return the active schema {version, schema, schema_hash, created_at, head} or None.
+
+    A single _id fetch of the active_schema pointer; head is the highest allocated version
+
+    (the base for promote_schema).
+
+    """
+
+    doc = _state.find_one({"_id": ACTIVE_SCHEMA_ID})
+
+    if doc:
+
+        return doc
+
+    # registry written before the pointer existed: seed it from the newest version
+
+    doc = _with_schema(_registry.find_one(sort=[("version", -1)], projection=HOT_FIELDS))
+
+    if doc is None:
+
+        return None
+
+    _state.update_one(
+
+        {"_id": ACTIVE_SCHEMA_ID},
 
-    doc = _registry.find_one(sort=[("version", -1)])
+        {"$setOnInsert": {**_active_fields(doc), "head": doc["version"]}},
+
+        upsert=True,
+
+    )
+
+    return _state.find_one({"_id": ACTIVE_SCHEMA_ID})
+
+
+
+def _remember(version, schema):
+
+    with _materialized_lock:
+
+        _materialized[version] = schema
+
+        _materialized.move_to_end(version)
+
+        if len(_materialized) > MATERIALIZE_CACHE_SIZE:
+
+            _materialized.popitem(last=False)
+
+
+
+def materialize_schema(version):
+
+    """
+
+    Full schema of any registered version, or None. Walks parent deltas back to the nearest
+
+    snapshot (or cached version) and replays them; results are cached in-process.
+
+    Treat the returned schema as read-only.
+
+    """
+
+    chain = []
+
+    v = version
+
+    while True:
+
+        with _materialized_lock:
+
+            schema = _materialized.get(v)
+
+        if schema is not None:
+
+            break
+
+        doc = _registry.find_one({"version": v}, {"schema": 1, "schema_delta": 1, "parent_version": 1})
+
+        if doc is None:
+
+            return None
+
+        if "schema" in doc:
+
+            schema = doc["schema"]
+
+            _remember(v, schema)
+
+            break
+
+        chain.append((v, doc["schema_delta"]))
+
+        v = doc["parent_version"]
+
+    for v, delta in reversed(chain):
+
+        schema = apply_patch(schema, delta)
+
+        _remember(v, schema)
+
+    return schema
+
+
+
+def _with_schema(doc):
+
+    """Fill in the full schema of a registry doc stored as a delta."""
+
+    if doc is not None and "schema" not in doc:
+
+        doc["schema"] = materialize_schema(doc["version"])
 
     return doc
 
 
 
-def create_new_version(schema, diff_summary, source_job_id, sample_docs, field_stats):
+def get_schema_details(version):
+
+    """Return {sample_docs, field_stats} stored for a version, or None."""
+
+    return _details.find_one({"_id": version})
+
+
+
+def _active_fields(meta):
+
+    return {
+
+        "version": meta["version"],
+
+        "schema": meta["schema"],
+
+        "schema_hash": meta.get("schema_hash"),
+
+        "created_at": meta.get("created_at"),
+
+        "delta_depth": meta.get("delta_depth", 0),
+
+        "registry_id": meta.get("_id"),
+
+    }
+
+
+
+def _set_active(meta, announce=False):
+
+    """
+
+    Point active_schema at meta; head only ever moves forward. announce publishes the schema
+
+    event (new versions and manual approvals, not reactivations by the worker).
+
+    """
+
+    _state.update_one(
+
+        {"_id": ACTIVE_SCHEMA_ID},
+
+        {"$set": _active_fields(meta), "$max": {"head": meta["version"]}},
+
+        upsert=True,
+
+    )
+
+    # DLQ revalidation (and anything else watching the active schema) runs off this event
+
+    if announce:
+
+        publish_version_change(meta["version"])
+
+
+
+def find_schema_by_hash(h):
+
+    """Return the registry doc whose canonical schema hash is h, or None (indexed lookup)."""
 
-    """Insert a new schema metadata doc and return it."""
+    if not h:
 
-    version = _next_version()
+        return None
 
-    meta = {
+    _ensure_registry()
 
-        "version": version,
+    return _with_schema(_registry.find_one({"schema_hash": h}, HOT_FIELDS, sort=[("version", -1)]))
+
+
+
+def reactivate_version(meta):
+
+    """Mark a known version as in use again (a source went back to an older shape)."""
+
+    _registry.update_one(
+
+        {"_id": meta["_id"]},
+
+        {"$set": {"reactivated_at": datetime.utcnow().isoformat()}, "$inc": {"reactivations": 1}},
+
+    )
+
+    _set_active(meta)
+
+    build_decoder(meta["schema"], meta.get("schema_hash"))
+
+    return meta
+
+
+
+def activate_version(version):
+
+    """Make a registered version the active schema (manual approval); returns its meta or None."""
+
+    meta = _with_schema(_registry.find_one({"version": version}, HOT_FIELDS))
+
+    if meta is None:
+
+        return None
+
+    _set_active(meta, announce=True)
+
+    build_decoder(meta["schema"], meta.get("schema_hash"))
+
+    return meta
+
+
+
+def _build_meta(schema, diff_summary, source_job_id):
+
+    # field_stats_sample duplicates the stats kept in the details collection
+
+    diff = {k: v for k, v in (diff_summary or {}).items() if k != "field_stats_sample"}
+
+    return {
+
+        "version": None,
 
         "schema": schema,
 
-        "diff": diff_summary,
+        "schema_hash": schema_hash(schema),
+
+        "diff": diff,
 
         "created_at": datetime.utcnow().isoformat(),
 
         "source_job_id": source_job_id,
 
-        "sample_docs": sample_docs,
+    }
 
-        "field_stats": field_stats,
 
-    }
 
-    _registry.insert_one(meta)
+def _store_details(version, sample_docs, field_stats):
+
+    _details.replace_one(
+
+        {"_id": version},
+
+        {"sample_docs": sample_docs, "field_stats": field_stats},
+
+        upsert=True,
+
+    )
+
+
+
+def _encode_for_storage(meta):
+
+    """Registry doc for meta: a full snapshot, or a JSON-patch delta against the active schema."""
+
+    parent = _state.find_one({"_id": ACTIVE_SCHEMA_ID}, {"version": 1, "schema": 1, "delta_depth": 1})
+
+    doc = {k: v for k, v in meta.items() if k != "schema"}
+
+    depth = parent.get("delta_depth", 0) + 1 if parent else 0
+
+    if parent is None or depth >= SCHEMA_SNAPSHOT_EVERY:
+
+        doc["schema"] = meta["schema"]
+
+        depth = 0
+
+    else:
+
+        doc["parent_version"] = parent["version"]
+
+        doc["schema_delta"] = make_patch(parent["schema"], meta["schema"])
+
+    doc["delta_depth"] = meta["delta_depth"] = depth
+
+    return doc
+
+
+
+def _insert_version(meta, doc):
+
+    doc["version"] = meta["version"]
+
+    doc.pop("_id", None)
+
+    _registry.insert_one(doc)
+
+    meta["_id"] = doc["_id"]
+
+    _remember(meta["version"], meta["schema"])
+
+
+
+def promote_schema(schema, base_version, diff_summary, source_job_id, sample_docs, field_stats):
+
+    """
+
+    Compare-and-set promotion: create base_version + 1 only if the latest version is still
+
+    base_version and no version with the same schema hash exists. base_version is the "head"
+
+    of get_latest_schema_meta() (the active version can be older after a reactivation).
+
+    Returns (meta, created). A worker that loses the race to the same schema gets the winner's
+
+    meta back (created=False) and should tag its documents with that version; meta is None when
+
+    base_version + 1 went to another schema, or its doc did not show up within
+
+    PROMOTE_WAIT_SECS (retry from a fresh head).
+
+    """
+
+    h = schema_hash(schema)
+
+    existing = find_schema_by_hash(h)
+
+    if existing:
+
+        return _adopt(existing), False
+
+    # the claim marks the new number as taken but not yet written; it goes once the doc is in
+
+    won = _state.find_one_and_update(
+
+        {"_id": VERSION_COUNTER_ID, "seq": base_version},
+
+        {"$inc": {"seq": 1}, "$set": {"claimed_at": datetime.utcnow()}},
+
+        return_document=ReturnDocument.AFTER,
+
+    )
+
+    if won:
+
+        meta = _build_meta(schema, diff_summary, source_job_id)
+
+        meta["version"] = won["seq"]
+
+        try:
+
+            _insert_version(meta, _encode_for_storage(meta))
+
+        except DuplicateKeyError:
+
+            # a slow winner from an earlier round already holds this version number
+
+            return _await_winner(base_version, h), False
+
+        _state.update_one({"_id": VERSION_COUNTER_ID, "claimed_at": won["claimed_at"]}, {"$unset": {"claimed_at": ""}})
+
+        _store_details(meta["version"], sample_docs, field_stats)
+
+        _set_active(meta, announce=True)
+
+        build_decoder(schema)
+
+        return meta, True
+
+    return _await_winner(base_version, h), False
+
+
+
+def _adopt(meta):
+
+    """
+
+    Make meta (a registered version) active if its promotion never got that far: its winner
+
+    died, or Mongo failed, between the registry insert and _set_active. Otherwise a no-op.
+
+    """
+
+    orphaned = _state.update_one(
+
+        {"_id": ACTIVE_SCHEMA_ID, "head": {"$lt": meta["version"]}},
+
+        {"$set": _active_fields(meta), "$max": {"head": meta["version"]}},
+
+    )
+
+    if orphaned.modified_count:
+
+        print(f"[versioning] v{meta['version']} was registered but never activated; activated it")
+
+        publish_version_change(meta["version"])
 
     return meta
 
 
+def _repair_head(version):
+
+    """Move head (and the counter) up to a registered version whose promotion did not finish."""
+
+    _state.update_one({"_id": ACTIVE_SCHEMA_ID}, {"$max": {"head": version}})
+
+    _state.update_one({"_id": VERSION_COUNTER_ID}, {"$max": {"seq": version}})
+
+
+def _await_winner(base_version, h):
+
+    """
+
+    Return the registry doc that won the promotion from base_version with this schema, or None
+
+    when base_version + 1 holds another schema or is not in yet.
+
+    """
+
+    deadline = time.monotonic() + PROMOTE_WAIT_SECS
+
+    while True:
+
+        winner = _registry.find_one({"schema_hash": h}, HOT_FIELDS)
+
+        if winner:
+
+            return _adopt(_with_schema(winner))
+
+        taken = _registry.find_one({"version": base_version + 1}, {"version": 1})
+
+        if taken:
+
+            # another schema won (its head may never have moved if its worker died): retry from it
+
+            _repair_head(taken["version"])
+
+            return None
+
+        if time.monotonic() >= deadline:
+
+            break
+
+        time.sleep(0.05)
+
+    # a winner slower than PROMOTE_WAIT_SECS is still working; only a claim left behind for
+
+    # PROMOTE_CLAIM_STALE_SECS means it died between the two writes. Roll the counter back (CAS
+
+    # on that claim) so promotions from base_version are possible again; the unique version
+
+    # index still protects us if the winner turns out to be alive after all.
+
+    counter = _state.find_one({"_id": VERSION_COUNTER_ID})
+
+    claimed_at = (counter or {}).get("claimed_at")
+
+    if (
+
+        claimed_at is not None
+
+        and counter["seq"] == base_version + 1
+
+        and (datetime.utcnow() - claimed_at).total_seconds() >= PROMOTE_CLAIM_STALE_SECS
+
+        and not _registry.find_one({"version": {"$gt": base_version}})
+
+    ):
+
+        reset = _state.update_one(
+
+            {"_id": VERSION_COUNTER_ID, "seq": counter["seq"], "claimed_at": claimed_at},
+
+            {"$set": {"seq": base_version}, "$unset": {"claimed_at": ""}},
+
+        )
+
+        if reset.modified_count:
+
+            print(f"[versioning] promotion from v{base_version} abandoned by another worker; counter reset")
+
+    return None
+
+
 
 def is_schema_equal(a, b):
 
-    """Lightweight equality check for schemas (compare JSON serializations)."""
+    """Lightweight equality check for schemas (compare canonical hashes)."""
 
     if a is None and b is None:
 
@@ -82,4 +658,4 @@ def is_schema_equal(a, b):
 
         return False
 
-    return orjson.dumps(a) == orjson.dumps(b)
+    return schema_hash(a) == schema_hash(b)
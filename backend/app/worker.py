@@ -1,6 +1,6 @@
 # backend/app/worker.py
 
-import os, time, orjson
+import os, time
 
 from datetime import datetime
 
@@ -10,57 +10,61 @@ import redis
 
 from .schema_infer import infer_schema_from_sample
 
-from .versioning import get_latest_schema_meta, create_new_version, is_schema_equal
+from .versioning import get_latest_schema_meta, promote_schema, find_schema_by_hash, reactivate_version
 
-from .storage import StorageManager
+from .storage import get_storage, STORAGE_BACKEND
 
-from .dlq import send_to_dlq
+from .dlq import send_failures, migrate_legacy_list
 
-from .validator import validate_doc_against_schema, decide_promotion
+from .validator import decide_promotion, schema_hash
 
+from .typed_decoder import decode_job, validate_docs
 
+from .schema_diff import merkle_tree, merkle_diff
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+from .indexes import ensure_indexes
 
-QUEUE_NAME = os.getenv("QUEUE_NAME", "chrysalis:ingest:queue")
+from .migrations import start_ingest_ts_migration
 
-BLPOP_TIMEOUT = int(os.getenv("BLPOP_TIMEOUT", "5"))
+from .retention import start_retention
 
+from .revalidate import start_revalidator
+
+from .ingest_counters import record_ingest
+
+from .dedupe import stamped, unstamped, DEDUPE_DOCS
 
 
-r = redis.from_url(REDIS_URL, decode_responses=False)
 
-storage = StorageManager()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+QUEUE_NAME = os.getenv("QUEUE_NAME", "chrysalis:ingest:queue")
 
+BLPOP_TIMEOUT = int(os.getenv("BLPOP_TIMEOUT", "5"))
 
-def compute_simple_diff(old_schema, new_schema, field_stats):
 
-    added, removed, changed = [], [], []
 
-    old_props = old_schema.get("properties", {}) if old_schema else {}
+r = redis.from_url(REDIS_URL, decode_responses=False)
 
-    new_props = new_schema.get("properties", {}) if new_schema else {}
+storage = get_storage()
 
-    for k in new_props:
 
-        if k not in old_props:
 
-            added.append(k)
+def compute_simple_diff(old_schema, new_schema, field_stats, old_key=None, new_key=None):
 
-        else:
+    """
 
-            if old_props[k] != new_props[k]:
+    added/removed/changed as nested property paths ("a", "a.b", "a.b[].c"). Subtrees are compared
 
-                changed.append(k)
+    by Merkle hash, so identical branches are skipped; old_key/new_key (canonical schema hashes)
 
-    for k in old_props:
+    let the trees be cached across jobs.
 
-        if k not in new_props:
+    """
 
-            removed.append(k)
+    paths = merkle_diff(merkle_tree(old_schema, old_key), merkle_tree(new_schema, new_key))
 
-    return {"added": added, "removed": removed, "changed": changed, "field_stats_sample": field_stats}
+    return {**paths, "field_stats_sample": field_stats}
 
 
 
@@ -68,13 +72,13 @@ def process_job(raw_msg_bytes):
 
     try:
 
-        job = orjson.loads(raw_msg_bytes)
+        job = decode_job(raw_msg_bytes)
 
     except Exception as e:
 
         print("Invalid job payload:", e)
 
-        send_to_dlq(raw_msg_bytes, reason="invalid_job_payload")
+        send_failures([{"doc": raw_msg_bytes.decode(errors="replace"), "reason": str(e)}], "invalid_job_payload")
 
         return
 
@@ -92,7 +96,9 @@ def process_job(raw_msg_bytes):
 
         print("Empty or invalid documents in job")
 
-        send_to_dlq(job, reason="empty_documents")
+        # only who sent it: the job itself can be arbitrarily large (e.g. documents not a list)
+
+        send_failures([{"doc": {"job_id": job_id, "source": job.get("source")}, "reason": "empty_documents"}], "empty_documents", job_id, source=job.get("source"))
 
         return
 
@@ -112,23 +118,63 @@ def process_job(raw_msg_bytes):
 
     latest_schema = latest_meta["schema"] if latest_meta else None
 
+    latest_hash = (latest_meta.get("schema_hash") or schema_hash(latest_schema)) if latest_meta else None
+
+    candidate_hash = schema_hash(candidate_schema)
+
+
+
+    # A shape we have already registered (e.g. a source going back to an older layout) is
+
+    # reactivated by hash instead of becoming a brand-new version
+
+    known_meta = find_schema_by_hash(candidate_hash) if candidate_hash != latest_hash else None
+
+    if known_meta:
+
+        reactivate_version(known_meta)
+
+        latest_meta, latest_schema, latest_hash = known_meta, known_meta["schema"], candidate_hash
+
+        print(f"Candidate matches registered v{known_meta['version']}; reactivating it")
+
 
 
-    diff = compute_simple_diff(latest_schema, candidate_schema, field_stats)
+    diff = compute_simple_diff(latest_schema, candidate_schema, field_stats, latest_hash, candidate_hash)
 
 
 
-    promote, reasons = decide_promotion(latest_schema, candidate_schema, field_stats)
+    promote, reasons = decide_promotion(latest_schema, candidate_schema, field_stats, latest_hash, candidate_hash)
 
     schema_version = latest_meta["version"] if latest_meta else 0
 
+    # the schema of the version the docs get tagged with; it types that version's Parquet columns
+
+    tagged_schema = latest_schema
+
+    # promotions are compare-and-set against the newest allocated version, not the active one
+
+    head_version = latest_meta.get("head", schema_version) if latest_meta else 0
+
     if promote:
 
-        new_meta = create_new_version(candidate_schema, diff, job_id, sample[:5], field_stats)
+        new_meta, created = promote_with_retry(candidate_schema, head_version, diff, job_id, sample[:5], field_stats)
+
+        if new_meta is None:
+
+            print(f"Promotion from v{head_version} did not settle; using latest v{schema_version}")
+
+        elif created:
+
+            print(f"New schema version created: v{new_meta['version']}; reasons: {reasons}")
+
+            schema_version, tagged_schema = new_meta["version"], new_meta["schema"]
+
+        else:
 
-        schema_version = new_meta["version"]
+            print(f"Promotion from v{head_version} already done by another worker; reusing v{new_meta['version']}")
 
-        print(f"New schema version created: v{schema_version}; reasons: {reasons}")
+            schema_version, tagged_schema = new_meta["version"], new_meta["schema"]
 
     else:
 
@@ -140,9 +186,19 @@ def process_job(raw_msg_bytes):
 
             # Edge case: no latest and not promoted -> promote anyway
 
-            new_meta = create_new_version(candidate_schema, diff, job_id, sample[:5], field_stats)
+            new_meta, _ = promote_with_retry(candidate_schema, head_version, diff, job_id, sample[:5], field_stats)
 
-            schema_version = new_meta["version"]
+            if new_meta is None:
+
+                # nothing to tag the documents with yet; put the job back for the next poll
+
+                r.rpush(QUEUE_NAME, raw_msg_bytes)
+
+                print(f"No prior schema and promotion did not settle; requeued job {job_id}")
+
+                return
+
+            schema_version, tagged_schema = new_meta["version"], new_meta["schema"]
 
             print(f"No prior schema; promoted to v{schema_version}")
 
@@ -158,19 +214,27 @@ def process_job(raw_msg_bytes):
 
     failed = []
 
-    for doc in docs:
+    # metadata is the same for every doc of the job; storage encodes it once (one BSON date per
 
-        ok, reason = validate_doc_against_schema(doc, validation_schema)
+    # job instead of an ISO string per document)
 
-        if ok:
+    meta = {
 
-            # attach metadata
+        "_schema_version": schema_version,
 
-            doc["_schema_version"] = schema_version
+        "_ingest_job_id": job_id,
 
-            doc["_ingest_job_id"] = job_id
+        "_ingest_ts": datetime.utcnow(),
 
-            doc["_ingest_ts"] = datetime.utcnow().isoformat()
+        # retention policies are per source
+
+        "_source": job.get("source", "unknown"),
+
+    }
+
+    for doc, (ok, reason) in zip(docs, validate_docs(docs, validation_schema)):
+
+        if ok:
 
             ok_docs.append(doc)
 
@@ -182,24 +246,95 @@ def process_job(raw_msg_bytes):
 
     if ok_docs:
 
-        n = storage.insert_many(ok_docs)
+        if DEDUPE_DOCS:
+
+            # hashed copies: the decoded job keeps the documents as they arrived
+
+            ok_docs = stamped(ok_docs)
+
+        n, insert_failed = storage.insert_many(ok_docs, schema=tagged_schema or validation_schema, meta=meta)
 
         print(f"Inserted {n} docs into raw_data (schema v{schema_version})")
 
+        record_ingest(n, meta["_source"], schema_version, meta["_ingest_ts"])
 
+        if storage.last_skipped:
 
-    if failed:
+            print(f"Skipped {storage.last_skipped} duplicate docs")
+
+        if insert_failed:
+
+            send_failures(unstamped(insert_failed), "insert_failed", job_id, schema_version, meta["_source"])
 
-        for f in failed:
+            print(f"Pushed {len(insert_failed)} docs that Mongo rejected to DLQ")
 
-            send_to_dlq(f, reason="validation_failed")
+
+
+    if failed:
+
+        send_failures(failed, "validation_failed", job_id, schema_version, meta["_source"])
 
         print(f"Pushed {len(failed)} docs to DLQ")
 
 
 
+def promote_with_retry(candidate_schema, head_version, diff, job_id, sample, field_stats, attempts=3):
+
+    """
+
+    promote_schema, retried from a re-read head while the race winner's registry doc is not in
+
+    yet. Returns (meta, created); meta is None if no version settled.
+
+    """
+
+    for _ in range(attempts):
+
+        new_meta, created = promote_schema(candidate_schema, head_version, diff, job_id, sample, field_stats)
+
+        if new_meta is not None:
+
+            return new_meta, created
+
+        latest = get_latest_schema_meta()
+
+        head_version = latest.get("head", latest["version"]) if latest else 0
+
+    return None, False
+
+
 def main_loop():
 
+    # raw_data indexes, the _ingest_ts backfill and TTL retention only apply to Mongo
+
+    if STORAGE_BACKEND == "mongo":
+
+        try:
+
+            ensure_indexes()
+
+        except Exception as e:
+
+            print("Index bootstrap failed:", e)
+
+        start_ingest_ts_migration()
+
+        start_retention()
+
+    start_revalidator(storage)
+
+    try:
+
+        moved = migrate_legacy_list()
+
+        if moved:
+
+            print(f"Moved {moved} legacy DLQ list entries to the DLQ stream")
+
+    except Exception as e:
+
+        print("DLQ migration failed:", e)
+
     print("Worker started, polling Redis...")
 
     while True:
@@ -216,12 +351,16 @@ def main_loop():
 
             else:
 
+                storage.flush(idle=True)
+
                 time.sleep(0.1)
 
         except KeyboardInterrupt:
 
             print("Worker stopping (keyboard interrupt)")
 
+            storage.flush()
+
             break
 
         except Exception as e:
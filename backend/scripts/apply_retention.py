@@ -0,0 +1,18 @@
+# backend/scripts/apply_retention.py
+"""
+Run the retention policies once (the worker also runs them every RETENTION_INTERVAL_SECS).
+usage: python backend/scripts/apply_retention.py ['{"*": {"days": 30, "action": "archive"}}']
+"""
+import os, sys, json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.retention import apply_retention, load_policies
+
+if __name__ == "__main__":
+    policies = load_policies(sys.argv[1]) if len(sys.argv) > 1 else load_policies()
+    if not policies:
+        print("no retention policies (set RETENTION_POLICIES or pass them as JSON)")
+        sys.exit(1)
+    for entry in apply_retention(policies):
+        print(json.dumps(entry))
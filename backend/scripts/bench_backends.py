@@ -0,0 +1,72 @@
+# backend/scripts/bench_backends.py
+"""
+Same workload against every StorageBackend: write throughput, then query latency for the reads
+the API/UI do (total count, count per version, newest docs of a version, field equality, ingest
+buckets). Mongo uses a scratch collection (bench_raw_data) and is skipped when MONGO_URL is not
+reachable; SQLite/DuckDB write to a temp directory; DuckDB is skipped without duckdb.
+usage: python backend/scripts/bench_backends.py [n_docs] [batch_size]
+"""
+import os, sys, time, tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.storage import StorageManager, mongo_db
+from backend.app.embedded_storage import SQLiteStorage, DuckDBStorage, duckdb
+
+def make_batches(n, batch_size):
+    ts = datetime.utcnow()
+    for start in range(0, n, batch_size):
+        version = 1 + (start // batch_size) % 3
+        docs = [
+            {"id": f"t{i}", "name": f"item-{i}", "price": i % 500, "tags": ["a", "b"]}
+            for i in range(start, min(n, start + batch_size))
+        ]
+        yield docs, {"_schema_version": version, "_ingest_job_id": f"bench-{start}", "_ingest_ts": ts}
+
+def backends(tmp):
+    try:
+        db = mongo_db()
+        db.client.admin.command("ping")
+        coll = db["bench_raw_data"]
+        coll.drop()
+        yield "mongo", StorageManager(collection=coll), coll.drop
+    except Exception as e:
+        print(f"mongo: skipped ({type(e).__name__})")
+    yield "sqlite", SQLiteStorage(os.path.join(tmp, "bench.db")), None
+    if duckdb is not None:
+        yield "duckdb", DuckDBStorage(os.path.join(tmp, "bench.duckdb")), None
+    else:
+        print("duckdb: skipped (not installed)")
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best * 1000
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tmp = tempfile.mkdtemp(prefix="chrysalis-bench-")
+    since = datetime.utcnow() - timedelta(hours=1)
+    print(f"{n} docs in batches of {batch_size}")
+    for name, storage, cleanup in backends(tmp):
+        t0 = time.perf_counter()
+        inserted = 0
+        for docs, meta in make_batches(n, batch_size):
+            inserted += storage.insert_many(docs, meta=meta)[0]
+        write = inserted / (time.perf_counter() - t0)
+        queries = {
+            "count": timed(lambda: storage.count()),
+            "count_v2": timed(lambda: storage.count(2)),
+            "recent_v2": timed(lambda: storage.find({"_schema_version": 2}, limit=20)),
+            "field_eq": timed(lambda: storage.find({"name": "item-4242"}, limit=20)),
+            "buckets": timed(lambda: storage.ingest_counts(since, 5)),
+        }
+        print(f"{name:>7}: {write:>10,.0f} docs/s  " + "  ".join(f"{k}={v:.1f}ms" for k, v in queries.items()))
+        if cleanup:
+            cleanup()
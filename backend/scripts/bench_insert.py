@@ -0,0 +1,34 @@
+# backend/scripts/bench_insert.py
+"""
+Insert throughput (docs/s) of StorageManager by chunk size, against MONGO_URL.
+Writes into a scratch collection (bench_raw_data) that is dropped before every run.
+usage: python backend/scripts/bench_insert.py [n_docs] [workers]
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.storage import StorageManager, mongo_db
+
+CHUNK_SIZES = [100, 500, 1000, 5000, 10000]
+
+def make_docs(n):
+    return [
+        {"id": f"t{i}", "name": f"item-{i}", "price": i % 500, "_schema_version": 1, "_ingest_job_id": "bench"}
+        for i in range(n)
+    ]
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    coll = mongo_db()["bench_raw_data"]
+    print(f"{n} docs, {workers} workers")
+    for chunk in CHUNK_SIZES:
+        coll.drop()
+        docs = make_docs(n)
+        storage = StorageManager(collection=coll, chunk_size=chunk, workers=workers)
+        t0 = time.perf_counter()
+        inserted, failed = storage.insert_many(docs)
+        dt = time.perf_counter() - t0
+        print(f"chunk={chunk:>6}  {inserted / dt:>10,.0f} docs/s  inserted={inserted} failed={len(failed)}")
+    coll.drop()
@@ -0,0 +1,57 @@
+# backend/scripts/bench_parquet_scan.py
+"""
+Single-field scan: Mongo find() with a projection vs ParquetSink.scan_column().
+Loads n_docs into a scratch collection (bench_raw_data) and a temp Parquet directory first.
+usage: python backend/scripts/bench_parquet_scan.py [n_docs]
+"""
+import os, sys, time, tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.storage import mongo_db
+from backend.app.parquet_sink import ParquetSink, scan_column
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "name": {"type": "string"},
+        "price": {"type": "integer"},
+        "tags": {"type": "array"},
+    },
+}
+
+def make_docs(n):
+    ts = datetime.utcnow()
+    return [
+        {"id": f"t{i}", "name": f"item-{i}", "price": i % 500, "tags": ["a", "b"],
+         "_schema_version": 1, "_ingest_job_id": "bench", "_ingest_ts": ts}
+        for i in range(n)
+    ]
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    coll = mongo_db()["bench_raw_data"]
+    coll.drop()
+    docs = make_docs(n)
+    coll.insert_many(docs, ordered=False)
+    root = tempfile.mkdtemp(prefix="chrysalis-parquet-")
+    sink = ParquetSink(root=root)
+    sink.write(docs, SCHEMA)
+    sink.flush()
+
+    t0 = time.perf_counter()
+    mongo_sum = sum(d["price"] for d in coll.find({}, {"price": 1, "_id": 0}))
+    t_mongo = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    col = scan_column("price", root=root)
+    parquet_sum = sum(c.to_numpy().sum() for c in col.chunks)
+    t_parquet = time.perf_counter() - t0
+
+    assert mongo_sum == parquet_sum
+    print(f"{n} docs, sum(price)")
+    print(f"mongo find+projection: {t_mongo * 1000:>9.1f} ms")
+    print(f"parquet scan_column:   {t_parquet * 1000:>9.1f} ms  ({t_mongo / t_parquet:.0f}x)")
+    coll.drop()
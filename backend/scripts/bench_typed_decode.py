@@ -0,0 +1,63 @@
+# backend/scripts/bench_typed_decode.py
+"""
+Measure decode+validate throughput of a worker job: orjson + Python validator vs. the worker's
+path (typed_decoder.decode_job + validate_docs: one msgspec decode, then a msgspec.convert type
+check of the decoded documents), on fixtures/test_batch.json-style data.
+usage: python backend/scripts/bench_typed_decode.py [n_docs] [bad_pct]
+"""
+import os, sys, time, json, random
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.schema_infer import infer_schema_from_sample
+from backend.app.validator import validate_batch
+from backend.app.typed_decoder import decode_job, validate_docs, get_decoder
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "..", "fixtures", "test_batch.json")
+
+def make_job(n, bad_pct):
+    with open(FIXTURE) as fh:
+        batch = json.load(fh)
+    base = batch["documents"]
+    rnd = random.Random(7)
+    docs = []
+    for i in range(n):
+        d = dict(base[i % len(base)])
+        d["id"] = f"t{i}"
+        d["price"] = "n/a" if rnd.random() < bad_pct else rnd.randint(1, 500)
+        docs.append(d)
+    return orjson.dumps({"job_id": "bench", "source": batch.get("source"), "documents": docs})
+
+def python_path(raw, schema):
+    docs = orjson.loads(raw)["documents"]
+    return validate_batch(docs, schema)
+
+def worker_path(raw, schema):
+    # what process_job does with a job
+    docs = decode_job(raw)["documents"]
+    return validate_docs(docs, schema)
+
+def bench(label, fn, raw, schema, n, rounds=5):
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        res = fn(raw, schema)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    accepted = sum(1 for ok, _ in res if ok)
+    print(f"{label:<22} {n / best:>12,.0f} docs/s  accepted={accepted}")
+    return best, res
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    bad_pct = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    raw = make_job(n, bad_pct)
+    with open(FIXTURE) as fh:
+        schema, _ = infer_schema_from_sample(json.load(fh)["documents"])
+    if get_decoder(schema) is None:
+        print("msgspec not installed; only the Python path is available")
+    t_py, res_py = bench("orjson + validator", python_path, raw, schema, n)
+    t_typed, res_typed = bench("worker (typed)", worker_path, raw, schema, n)
+    assert res_py == res_typed, "typed path disagrees with the Python validator"
+    print(f"speedup: {t_py / t_typed:.2f}x")
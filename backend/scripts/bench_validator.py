@@ -0,0 +1,64 @@
+# backend/scripts/bench_validator.py
+"""
+Benchmark the compiled validator against the jsonschema library.
+usage: python backend/scripts/bench_validator.py [n_docs]
+"""
+import os, sys, time, json, random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.validator import validate_batch, shape_cache_stats
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "..", "fixtures", "test_batch.json")
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string", "pattern": "^t\\d+$"},
+        "name": {"type": "string", "minLength": 2},
+        "price": {"type": "integer", "minimum": 0, "maximum": 1000},
+        "status": {"type": "string", "enum": ["new", "paid", "shipped"]},
+        "created_at": {"type": "string", "format": "date-time"},
+    },
+    "required": ["id", "name", "price"],
+}
+
+def make_docs(n):
+    with open(FIXTURE) as fh:
+        base = json.load(fh)["documents"]
+    rnd = random.Random(42)
+    docs = []
+    for i in range(n):
+        d = dict(base[i % len(base)])
+        d["id"] = f"t{i}"
+        d["price"] = rnd.randint(0, 1200)
+        d["status"] = rnd.choice(["new", "paid", "shipped", "lost"])
+        d["created_at"] = f"2025-11-{1 + i % 28:02d}T10:{i % 60:02d}:00Z"
+        docs.append(d)
+    return docs
+
+def bench(label, fn, docs):
+    t0 = time.perf_counter()
+    accepted = fn(docs)
+    dt = time.perf_counter() - t0
+    print(f"{label:<24} {len(docs) / dt:>12,.0f} docs/s  accepted={accepted}")
+    return dt
+
+def run_compiled(docs):
+    return sum(1 for ok, _ in validate_batch(docs, SCHEMA) if ok)
+
+def run_jsonschema(docs):
+    import jsonschema
+    v = jsonschema.Draft7Validator(SCHEMA, format_checker=jsonschema.FormatChecker())
+    return sum(1 for d in docs if v.is_valid(d))
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    docs = make_docs(n)
+    t_compiled = bench("compiled validator", run_compiled, docs)
+    print("shape cache:", shape_cache_stats())
+    try:
+        t_js = bench("jsonschema Draft7", run_jsonschema, docs)
+        print(f"speedup: {t_js / t_compiled:.1f}x")
+    except ImportError:
+        print("jsonschema not installed; skipping comparison")
@@ -0,0 +1,27 @@
+# backend/scripts/drop_partitions.py
+"""
+Drop whole raw_data partitions (see RAW_PARTITION_MODE).
+usage: python backend/scripts/drop_partitions.py --before 2026-01-01
+       python backend/scripts/drop_partitions.py --versions 1 2 3
+       python backend/scripts/drop_partitions.py --list
+"""
+import os, sys, argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.partitions import RawDataRouter, list_partitions
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--before", help="drop time partitions ending on or before this date (YYYY-MM-DD)")
+    ap.add_argument("--versions", nargs="*", type=int, help="drop these version partitions")
+    ap.add_argument("--list", action="store_true", help="only list the partitions")
+    args = ap.parse_args()
+    if args.list or (not args.before and not args.versions):
+        for name in list_partitions():
+            print(name)
+        sys.exit(0)
+    before = datetime.fromisoformat(args.before) if args.before else None
+    dropped = RawDataRouter().drop_partitions(before=before, versions=args.versions)
+    print(f"dropped {len(dropped)} partitions: {', '.join(dropped) or '-'}")
@@ -0,0 +1,17 @@
+# backend/scripts/migrate_ingest_ts.py
+"""
+Convert legacy ISO-string _ingest_ts values in raw_data to BSON dates (the worker also does this
+in the background at startup unless MIGRATE_INGEST_TS=0).
+usage: python backend/scripts/migrate_ingest_ts.py [batch_size] [pause_secs]
+"""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.migrations import migrate_ingest_ts
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    pause = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    converted, skipped = migrate_ingest_ts(batch_size=batch_size, pause=pause)
+    print(f"converted={converted} unparseable={skipped}")
@@ -2,54 +2,44 @@
 
 import os, json, sys
 
-from pymongo import MongoClient
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-import redis, orjson
+from backend.app.dlq import list_entries, dlq_stats, public_entry
 
+PAGE = 100
 
+def print_dlq(reason=None):
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    stats = dlq_stats()
 
-DLQ = os.getenv("DLQ_NAME", "chrysalis:dlq")
+    print("DLQ length:", stats["total"], f"({stats['redis_entries']} in Redis, {stats['spilled_entries']} spilled)")
 
+    for name, n in stats["by_reason"].items():
 
+        print(f"  {name}: {n}")
 
-r = redis.from_url(REDIS_URL, decode_responses=True)
+    cursor, i = None, 0
 
+    while True:
 
+        items, cursor = list_entries(reason=reason, cursor=cursor, limit=PAGE)
 
-def print_dlq():
+        for item in items:
 
-    n = r.llen(DLQ)
+            print(f"--- DLQ item {i} ({item['id']}) ---")
 
-    print("DLQ length:", n)
+            print(json.dumps(public_entry(item), indent=2, default=str))
 
-    items = r.lrange(DLQ, 0, -1)
+            i += 1
 
-    if not items:
+        if cursor is None:
 
-        print("DLQ empty.")
-
-        return
-
-    for i, it in enumerate(items):
-
-        try:
-
-            parsed = orjson.loads(it)
-
-            print(f"--- DLQ item {i} ---")
-
-            print(json.dumps(parsed, indent=2, default=str))
-
-        except Exception:
-
-            print("--- DLQ item raw ---")
-
-            print(it)
+            break
 
+    if i == 0:
 
+        print("DLQ empty.")
 
 if __name__ == "__main__":
 
-    print_dlq()
+    print_dlq(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,31 @@
+# backend/scripts/restore_archive.py
+"""
+Stream retention archives (*.ndjson.gz) back into Mongo.
+usage: python backend/scripts/restore_archive.py <file or directory> [collection]
+The default collection is raw_data_restored; pass raw_data to put documents back in the hot
+collection (retention will archive them again once they are past their cutoff).
+"""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app.retention import restore_archive
+
+def archive_files(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(d, f) for d, _, files in os.walk(path) for f in files if f.endswith(".ndjson.gz")
+    )
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    collection = sys.argv[2] if len(sys.argv) > 2 else None
+    total = 0
+    for f in archive_files(sys.argv[1]):
+        n = restore_archive(f, collection)
+        total += n
+        print(f"{f}: {n} docs")
+    print(f"restored {total} docs")
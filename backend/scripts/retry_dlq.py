@@ -1,34 +1,51 @@
 # backend/scripts/retry_dlq.py
 
-import os, orjson, redis
+"""
+Replay dead-lettered documents through the pipeline (see backend/app/dlq_replay.py).
+usage: python backend/scripts/retry_dlq.py [--reason validation_failed] [--since 2026-01-01T00:00]
+           [--until ...] [--max-entries N] [--rate DOCS_PER_SEC] [--dry-run]
+"""
 
-REDIS_URL = os.getenv("REDIS_URL","redis://localhost:6379/0")
+import os, sys, json, argparse
 
-DLQ = os.getenv("DLQ_NAME","chrysalis:dlq")
+from datetime import datetime
 
-QUEUE_NAME = os.getenv("QUEUE_NAME","chrysalis:ingest:queue")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-r = redis.from_url(REDIS_URL, decode_responses=True)
+from backend.app.dlq_replay import replay, REPLAY_REASONS
 
-def retry_first(n=1):
+if __name__ == "__main__":
 
-    for _ in range(n):
+    ap = argparse.ArgumentParser()
 
-        item = r.lpop(DLQ)
+    ap.add_argument("--reason", choices=REPLAY_REASONS, help="default: every replayable reason")
 
-        if not item:
+    ap.add_argument("--since", type=datetime.fromisoformat, help="dead-lettered at or after (UTC, ISO)")
 
-            print("DLQ empty")
+    ap.add_argument("--until", type=datetime.fromisoformat, help="dead-lettered at or before (UTC, ISO)")
 
-            return
+    ap.add_argument("--max-entries", type=int)
 
-        # push to ingest queue (right push)
+    ap.add_argument("--rate", type=float, help="documents per second to enqueue (default REPLAY_RATE, 0 = no limit)")
 
-        r.rpush(QUEUE_NAME, item)
+    ap.add_argument("--dry-run", action="store_true", help="validate and count only")
 
-        print("Requeued item")
+    args = ap.parse_args()
 
-if __name__ == "__main__":
+    stats = replay(
+
+        reason=args.reason,
+
+        since=args.since,
+
+        until=args.until,
+
+        max_entries=args.max_entries,
+
+        rate=args.rate,
+
+        dry_run=args.dry_run,
 
-    retry_first(10)
+    )
 
+    print(json.dumps(stats))
@@ -9,12 +9,18 @@ import redis as redislib
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 DLQ_NAME = os.getenv("DLQ_NAME", "chrysalis:dlq")
+DLQ_STREAM = os.getenv("DLQ_STREAM", f"{DLQ_NAME}:stream")
 API_URL = os.getenv("API_URL", "http://backend:8000")
 PROMOTE_TOKEN = os.getenv("PROMOTE_TOKEN", "demo-token")
 
 client = MongoClient(MONGO_URL)
 db = client["chrysalis"]
 
+def raw_collections():
+    # raw_data plus its partitions (raw_data_v<N>, raw_data_<YYYYMMDD>, raw_data_<YYYYMM>)
+    names = db.list_collection_names(filter={"name": {"$regex": r"^raw_data(_(v\d+|\d{8}|\d{6}))?$"}})
+    return [db[n] for n in sorted(names)]
+
 st.set_page_config(page_title="Project Chrysalis — Demo", layout="wide", initial_sidebar_state="expanded")
 
 # Custom CSS
@@ -51,7 +57,7 @@ except:
     health_status = "🔴 DOWN"
 
 try:
-    raw_count = db.raw_data.count_documents({})
+    raw_count = sum(c.count_documents({}) for c in raw_collections())
 except:
     raw_count = "n/a"
 
@@ -62,7 +68,8 @@ except:
 
 try:
     rconn = redislib.from_url(REDIS_URL, decode_responses=False)
-    dlq_len = rconn.llen(DLQ_NAME)
+    # entries in Redis plus those spilled to the cold tier
+    dlq_len = rconn.xlen(DLQ_STREAM) + sum(int(n) for n in rconn.hvals(f"{DLQ_NAME}:spilled"))
 except:
     dlq_len = "n/a"
 
@@ -85,9 +92,9 @@ col_left, col_mid, col_right = st.columns([2, 2, 2])
 with col_left:
     st.header("📋 Latest Schema")
     try:
-        latest = list(db.schema_registry.find().sort("version", -1).limit(1))
-        if latest:
-            latest_doc = latest[0]
+        # active schema pointer: one _id fetch, holds the full (materialized) schema
+        latest_doc = db.registry_state.find_one({"_id": "active_schema"})
+        if latest_doc:
             st.write(f"**Version:** {latest_doc.get('version', 'N/A')}")
             st.write(f"**Created:** {latest_doc.get('created_at', 'N/A')}")
             
@@ -101,7 +108,7 @@ with col_left:
                     # Try to call approve endpoint if exists
                     resp = requests.post(
                         f"{API_URL}/approve",
-                        json={"schema_id": str(latest_doc.get("_id")), "token": PROMOTE_TOKEN},
+                        json={"schema_id": str(latest_doc.get("registry_id")), "token": PROMOTE_TOKEN},
                         timeout=5
                     )
                     if resp.status_code == 200:
@@ -112,7 +119,7 @@ with col_left:
                     # Fallback: write flag to pending_promotions
                     try:
                         db.schema_registry.update_one(
-                            {"_id": latest_doc["_id"]},
+                            {"_id": latest_doc["registry_id"]},
                             {"$set": {"pending_promotion": True, "promoted_at": datetime.utcnow().isoformat()}}
                         )
                         st.success("Promotion flag set!")
@@ -138,7 +145,13 @@ with col_mid:
         if schema_filter != "All":
             query["_schema_version"] = int(schema_filter)
         
-        rows = list(db.raw_data.find(query).sort([("_id", -1)]).limit(20))
+        colls = raw_collections()
+        if schema_filter != "All" and db[f"raw_data_v{schema_filter}"] in colls:
+            colls = [c for c in colls if c.name in ("raw_data", f"raw_data_v{schema_filter}")]
+        rows = []
+        for c in colls:
+            rows.extend(c.find(query).sort([("_id", -1)]).limit(20))
+        rows = sorted(rows, key=lambda r: r["_id"], reverse=True)[:20]
         if rows:
             df_raw = pd.DataFrame([json.loads(json.dumps(r, default=str)) for r in rows])
             # Clean up display
@@ -160,31 +173,32 @@ with col_right:
     
     try:
         rconn_dlq = redislib.from_url(REDIS_URL, decode_responses=True)
-        dlq_items_raw = rconn_dlq.lrange(DLQ_NAME, 0, 19)
+        # newest 20 entries only; the stream is never read whole
+        dlq_entries = rconn_dlq.xrevrange(DLQ_STREAM, count=20)
         
-        if dlq_items_raw:
-            st.write(f"**Total items:** {len(dlq_items_raw)}")
+        if dlq_entries:
+            st.write(f"**Total items:** {dlq_len}")
             
             dlq_items = []
-            for i, item in enumerate(dlq_items_raw):
+            for entry_id, fields in dlq_entries:
                 try:
-                    parsed = json.loads(item)
-                    dlq_items.append({"index": i, "data": parsed})
+                    payload = json.loads(fields.get("payload", "null"))
                 except:
-                    dlq_items.append({"index": i, "data": {"raw": item[:100]}})
+                    payload = {"raw": fields.get("payload", "")[:100]}
+                dlq_items.append({"id": entry_id, "data": {"reason": fields.get("reason"), "timestamp": fields.get("ts"), "payload": payload}})
             
             for item in dlq_items[:10]:
-                with st.expander(f"DLQ Item #{item['index']}", expanded=False):
+                with st.expander(f"DLQ Item {item['id']}", expanded=False):
                     reason = item['data'].get('reason', 'unknown')
                     st.write(f"**Reason:** {reason}")
                     st.json(item['data'])
                     
-                    if st.button(f"🔄 Retry", key=f"retry_{item['index']}"):
+                    if st.button(f"🔄 Retry", key=f"retry_{item['id']}"):
                         try:
-                            # Requeue to ingest queue
-                            rconn_ingest = redislib.from_url(REDIS_URL, decode_responses=False)
-                            rconn_ingest.rpush("chrysalis:ingest:queue", json.dumps(item['data']))
-                            st.success("Requeued!")
+                            # the API rebuilds ingest jobs from the entry's documents
+                            resp = requests.post(f"{API_URL}/dlq/replay", params={"entry_id": item['id']}, timeout=30)
+                            resp.raise_for_status()
+                            st.success(f"Requeued {resp.json()['requeued']} docs!")
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error: {e}")
@@ -193,12 +207,11 @@ with col_right:
                 st.caption(f"... and {len(dlq_items) - 10} more items")
             
             # Bulk retry
-            if st.button("🔄 Retry All (First 10)", key="retry_all"):
+            if st.button("🔄 Retry Oldest 10", key="retry_all"):
                 try:
-                    rconn_ingest = redislib.from_url(REDIS_URL, decode_responses=False)
-                    for i in range(min(10, len(dlq_items_raw))):
-                        rconn_ingest.rpush("chrysalis:ingest:queue", dlq_items_raw[i])
-                    st.success(f"Requeued {min(10, len(dlq_items_raw))} items!")
+                    resp = requests.post(f"{API_URL}/dlq/replay", params={"max_entries": 10}, timeout=60)
+                    resp.raise_for_status()
+                    st.success(f"Requeued {resp.json()['requeued']} docs!")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error: {e}")